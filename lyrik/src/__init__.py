@@ -1,20 +1,83 @@
-from adaptor import *
-from netwrok_interface import *
-from netease_music_interface import *
-from mpris_watcher import *
-from interface_manager import *
+import importlib
 
 __all__ = [
     "AbstractAdaptor",
     "AbstractNetworkInterface",
     "NeteaseMusicInterface",
+    "LocalLibraryInterface",
     "MprisWatcher",
     "NoFoundError",
     "LyricsResponse",
-    "AbstractNetworkInterface",
     "AllNoFoundError",
     "InternetError",
-    "AbstractAdaptor",
     "InterfaceManager",
     "NetworkError",
+    "LyricsTimeline",
+    "TimelineCursor",
+    "WordCursor",
+    "ParsedLyrics",
+    "ParsedLyricsCache",
+    "StringTable",
+    "LyricsCache",
+    "AbstractTransport",
+    "HttpTransport",
+    "StubTransport",
+    "TransportError",
+    "ProviderHealth",
+    "TokenBucket",
+    "TrackPrefetcher",
+    "Candidate",
+    "CandidateRanker",
+    "RankedCandidate",
+    "PlayerSupervisor",
+    "ActivePlayer",
+    "PluginRegistry",
+    "Metrics",
+    "Histogram",
+    "MetricsAdaptor",
 ]
+
+# The module defining every public name. They are imported on first access,
+# so that importing the package does not import every provider's dependencies.
+_MODULES = {
+    "AbstractAdaptor": "adaptor",
+    "AbstractNetworkInterface": "netwrok_interface",
+    "NeteaseMusicInterface": "netease_music_interface",
+    "LocalLibraryInterface": "local_library_interface",
+    "MprisWatcher": "mpris_watcher",
+    "NoFoundError": "netwrok_interface",
+    "LyricsResponse": "netwrok_interface",
+    "AllNoFoundError": "interface_manager",
+    "InternetError": "netwrok_interface",
+    "InterfaceManager": "interface_manager",
+    "NetworkError": "interface_manager",
+    "LyricsTimeline": "lyrics_timeline",
+    "TimelineCursor": "lyrics_timeline",
+    "WordCursor": "lyrics_timeline",
+    "ParsedLyrics": "lyrics_timeline",
+    "ParsedLyricsCache": "lyrics_timeline",
+    "StringTable": "lyrics_timeline",
+    "LyricsCache": "lyrics_cache",
+    "AbstractTransport": "transport",
+    "HttpTransport": "transport",
+    "StubTransport": "transport",
+    "TransportError": "transport",
+    "ProviderHealth": "provider_health",
+    "TokenBucket": "provider_health",
+    "TrackPrefetcher": "track_prefetcher",
+    "Candidate": "candidate_ranking",
+    "CandidateRanker": "candidate_ranking",
+    "RankedCandidate": "candidate_ranking",
+    "PlayerSupervisor": "player_supervisor",
+    "ActivePlayer": "player_supervisor",
+    "PluginRegistry": "plugin_registry",
+    "Metrics": "metrics",
+    "Histogram": "metrics",
+    "MetricsAdaptor": "metrics_adaptor",
+}
+
+
+def __getattr__(name: str):
+    if name in _MODULES:
+        return getattr(importlib.import_module(_MODULES[name]), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
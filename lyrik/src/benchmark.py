@@ -0,0 +1,345 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import statistics
+import subprocess
+import threading
+import time
+
+from dbus_next import Message
+from dbus_next.aio import MessageBus
+from dbus_next.service import ServiceInterface, dbus_property, PropertyAccess, signal
+from dbus_next.signature import Variant
+
+from netwrok_interface import AbstractNetworkInterface, LyricsResponse, NoFoundError, InternetError
+from interface_manager import InterfaceManager
+from lyrics_cache import LyricsCache
+from lyrics_timeline import LyricsTimeline, ParsedLyricsCache
+from mpris_watcher import MprisWatcher
+from dbus_adaptor import DBusAdaptor
+from metrics import metrics
+
+
+class BenchmarkTrack:
+    __slots__ = ("title", "album", "artist", "length", "lyrics", "timeline")
+
+    def __init__(self, number: int, length: int, line_interval: int) -> None:
+        """
+        :param number: int: The position of the track in the play list
+        :param length: int: The length of the track in microseconds
+        :param line_interval: int: The time between two lyric lines in microseconds
+        """
+        self.title: str = f"Benchmark Track {number:03d}"
+        self.album: str = "LyriK Benchmark"
+        self.artist: list[str] = ["LyriK"]
+        self.length: int = length
+        lines = []
+        for (i, timestamp) in enumerate(range(line_interval, length, line_interval)):
+            (minutes, seconds) = divmod(timestamp // 10000, 6000)
+            lines.append(f"[{minutes:02d}:{seconds // 100:02d}.{seconds % 100:02d}]Line {i} of track {number}")
+        self.lyrics: str = "\n".join(lines)
+        self.timeline: LyricsTimeline = LyricsTimeline.parse(self.lyrics)
+
+    def metadata(self) -> dict[str, Variant]:
+        return {
+            "mpris:trackid": Variant("o", f"/org/lyrik/benchmark/{self.title[-3:]}"),
+            "mpris:length": Variant("x", self.length),
+            "xesam:title": Variant("s", self.title),
+            "xesam:album": Variant("s", self.album),
+            "xesam:artist": Variant("as", self.artist),
+        }
+
+
+class FakePlayer(ServiceInterface):
+    """
+    The `FakePlayer` class is a scriptable `org.mpris.MediaPlayer2.Player`.
+    It plays on the real monotonic clock, so the true time of every lyric
+    line is known: `started` plus the timestamp of the line.
+    """
+
+    def __init__(self, tracks: list[BenchmarkTrack]) -> None:
+        super().__init__("org.mpris.MediaPlayer2.Player")
+        self.tracks: list[BenchmarkTrack] = tracks
+        self.current: int = 0
+        self.started: float = time.monotonic()
+        self.status: str = "Stopped"
+
+    def play(self, number: int) -> None:
+        self.current = number
+        self.started = time.monotonic()
+        self.status = "Playing"
+        self.emit_properties_changed({"Metadata": self.Metadata, "PlaybackStatus": self.status})
+
+    def seek(self, position: int) -> None:
+        self.started = time.monotonic() - position / 1000000
+        self.Seeked()
+
+    @property
+    def track(self) -> BenchmarkTrack:
+        return self.tracks[self.current]
+
+    @dbus_property(PropertyAccess.READ)
+    def Metadata(self) -> "a{sv}":
+        return self.track.metadata()
+
+    @dbus_property(PropertyAccess.READ)
+    def Position(self) -> "x":
+        return int((time.monotonic() - self.started) * 1000000)
+
+    @dbus_property(PropertyAccess.READ)
+    def PlaybackStatus(self) -> "s":
+        return self.status
+
+    @dbus_property(PropertyAccess.READ)
+    def Rate(self) -> "d":
+        return 1.0
+
+    @signal()
+    def Seeked(self) -> "x":
+        return int((time.monotonic() - self.started) * 1000000)
+
+
+class BenchmarkInterface(AbstractNetworkInterface):
+    """
+    The `BenchmarkInterface` class is an in-process stub provider answering
+    from the lyrics of the benchmark tracks after `Latency` milliseconds,
+    failing with an `InternetError` at `ErrorRate`, drawn from a seeded
+    random generator so that runs are reproducible.
+    """
+
+    def __init__(self, transport=None, config: dict[str] | None = None) -> None:
+        super().__init__(transport, config)
+        self.__latency: float = self.config.get("Latency", 50) / 1000
+        self.__error_rate: float = self.config.get("ErrorRate", 0.0)
+        self.__random: random.Random = random.Random(self.config.get("Seed", 0))
+        self.__lyrics: dict[str, str] = self.config.get("Lyrics", {})
+
+    @classmethod
+    def name(cls) -> str:
+        return "BenchmarkInterface"
+
+    async def get_lyrics(
+        self, title: str, album: str, artist: list, hazy_search=True, length: int | None = None
+    ) -> LyricsResponse:
+        failed = self.__random.random() < self.__error_rate
+        await asyncio.sleep(self.__latency)
+        if failed:
+            raise InternetError(self)
+        if title not in self.__lyrics:
+            raise NoFoundError(self, title, artist, album)
+        return LyricsResponse(False, self.__lyrics[title], None, self.name())
+
+
+def percentiles(samples: list[float]) -> dict[str, float | int | None]:
+    if len(samples) == 0:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "max": None}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+    return {
+        "count": len(ordered),
+        "mean": statistics.fmean(ordered),
+        "p50": pick(0.5),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": ordered[-1],
+    }
+
+
+def rss() -> int:
+    """
+    Returns the resident set size of the process in KiB.
+    """
+    with open("/proc/self/statm") as file:
+        return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+
+
+class Benchmark:
+    """
+    The `Benchmark` class plays a list of generated tracks on a `FakePlayer`
+    in a private `dbus-daemon` session and follows it with a `MprisWatcher`
+    and its `DBusAdaptor`, like the service does. The player runs on its own
+    thread and bus connection, so the CPU time of the watcher's thread is
+    the cost of following playback.
+    """
+
+    def __init__(self, options: argparse.Namespace) -> None:
+        self.__options: argparse.Namespace = options
+        self.__tracks: list[BenchmarkTrack] = [
+            BenchmarkTrack(i, int(options.track_length * 1000000), options.line_interval * 1000)
+            for i in range(options.tracks)
+        ]
+        self.__player: FakePlayer = FakePlayer(self.__tracks)
+        self.__player_loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+
+        self.__messages_in: int = 0
+        self.__messages_out: int = 0
+        self.__line_latency: list[float] = []
+        self.__time_to_lyrics: list[float] = []
+        self.__track_changed: float | None = None
+        self.__last: tuple[str, int] = ("", -1)
+
+    def __run_player(self, address: str, ready: threading.Event) -> None:
+        async def serve() -> None:
+            bus = await MessageBus(bus_address=address).connect()
+            bus.export("/org/mpris/MediaPlayer2", self.__player)
+            await bus.request_name("org.mpris.MediaPlayer2.benchmark")
+            ready.set()
+            await bus.wait_for_disconnect()
+
+        asyncio.set_event_loop(self.__player_loop)
+        try:
+            self.__player_loop.run_until_complete(serve())
+        except (EOFError, OSError):
+            pass
+
+    def __in_player(self, func, *args) -> None:
+        self.__player_loop.call_soon_threadsafe(func, *args)
+
+    def __on_updated(self, watcher: MprisWatcher) -> None:
+        now = time.monotonic()
+        track = self.__player.track
+        if watcher.title != track.title:
+            return
+        if self.__track_changed is not None and len(watcher.timeline) > 0:
+            self.__time_to_lyrics.append((now - self.__track_changed) * 1000)
+            self.__track_changed = None
+        (title, index) = self.__last
+        self.__last = (watcher.title, watcher.index)
+        # Only a step to the next line is a line change; seeks and new songs jump.
+        if title == watcher.title and watcher.index == index + 1 and index >= 0:
+            true_time = self.__player.started + watcher.timeline.timestamps[watcher.index] / 1000000
+            self.__line_latency.append((now - true_time) * 1000)
+
+    def __count_message(self, message: Message) -> None:
+        self.__messages_in += 1
+        return None
+
+    async def run(self) -> dict:
+        daemon = subprocess.Popen(
+            ["dbus-daemon", "--session", "--nofork", "--print-address"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        try:
+            address = daemon.stdout.readline().strip()
+            ready = threading.Event()
+            thread = threading.Thread(target=self.__run_player, args=(address, ready), daemon=True)
+            thread.start()
+            ready.wait()
+            return await self.__measure(address)
+        finally:
+            daemon.kill()
+            daemon.wait()
+
+    async def __measure(self, address: str) -> dict:
+        options = self.__options
+        bus = await MessageBus(bus_address=address).connect()
+        bus.add_message_handler(self.__count_message)
+        send = bus.send
+
+        def count_send(message: Message):
+            self.__messages_out += 1
+            return send(message)
+
+        bus.send = count_send
+
+        manager = InterfaceManager(
+            None,
+            {
+                "Disabled": ["NeteaseMusicInterface", "LocalLibraryInterface"],
+                "Priority": ["BenchmarkInterface"],
+                "BenchmarkInterface": {
+                    "Latency": options.latency,
+                    "ErrorRate": options.error_rate,
+                    "Seed": options.seed,
+                    "Lyrics": {track.title: track.lyrics for track in self.__tracks},
+                },
+            },
+            LyricsCache(":memory:"),
+        )
+        # A private cache in memory, so that every run parses the same lyrics and the user's cache is left alone.
+        watcher = MprisWatcher(
+            bus, "benchmark", {"Debounce": options.debounce}, manager, parsed_cache=ParsedLyricsCache()
+        )
+        adaptor = DBusAdaptor(bus, "Player", watcher)
+        watcher.add_callable(adaptor.update)
+        watcher.add_callable(lambda: self.__on_updated(watcher))
+        bus.export("/org/LyriK/Player/benchmark", adaptor)
+        await bus.request_name("org.LyriK")
+
+        rss_before = rss()
+        self.__track_changed = time.monotonic()
+        self.__in_player(self.__player.play, 0)
+        task = asyncio.ensure_future(watcher.watch())
+        await asyncio.sleep(0.2)
+
+        messages = (self.__messages_in, self.__messages_out)
+        metrics.reset()
+        cpu_thread = time.thread_time()
+        cpu_process = time.process_time()
+        started = time.monotonic()
+        for number in range(len(self.__tracks)):
+            if number > 0:
+                self.__track_changed = time.monotonic()
+                self.__in_player(self.__player.play, number)
+            if options.seek:
+                await asyncio.sleep(options.track_length / 2)
+                self.__in_player(self.__player.seek, int(options.track_length / 4 * 1000000))
+                await asyncio.sleep(options.track_length / 2)
+            else:
+                await asyncio.sleep(options.track_length)
+        elapsed = time.monotonic() - started
+        cpu_thread = time.thread_time() - cpu_thread
+        cpu_process = time.process_time() - cpu_process
+        messages = (self.__messages_in - messages[0], self.__messages_out - messages[1])
+
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        bus.disconnect()
+
+        return {
+            "options": vars(options),
+            "playback_seconds": elapsed,
+            "cpu_seconds_per_minute": cpu_thread / elapsed * 60,
+            "process_cpu_seconds_per_minute": cpu_process / elapsed * 60,
+            "bus_messages_per_second": {
+                "received": messages[0] / elapsed,
+                "sent": messages[1] / elapsed,
+                "total": (messages[0] + messages[1]) / elapsed,
+            },
+            "line_change_latency_ms": percentiles(self.__line_latency),
+            "time_to_lyrics_ms": percentiles(self.__time_to_lyrics),
+            "tracks_without_lyrics": len(self.__tracks) - len(self.__time_to_lyrics),
+            "stages_us": {
+                f"{stage}/{provider}" if provider != "" else stage: histogram.summary()
+                for ((stage, provider), histogram) in sorted(metrics.histograms.items())
+            },
+            "rss_kib": {"before": rss_before, "after": rss(), "max": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark LyriK against a fake MPRIS player and a stub provider.")
+    parser.add_argument("--tracks", type=int, default=5, help="number of tracks played")
+    parser.add_argument("--track-length", type=float, default=12, help="length of a track in seconds")
+    parser.add_argument("--line-interval", type=int, default=250, help="time between lyric lines in milliseconds")
+    parser.add_argument("--latency", type=float, default=50, help="latency of the stub provider in milliseconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability of a stub provider failure")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the stub provider failures")
+    parser.add_argument("--debounce", type=float, default=150, help="track change debounce in milliseconds")
+    parser.add_argument("--seek", action="store_true", help="seek back in the middle of every track")
+    parser.add_argument("--output", default="benchmark.json", help="where to write the results as JSON")
+    options = parser.parse_args()
+
+    results = asyncio.run(Benchmark(options).run())
+    with open(options.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
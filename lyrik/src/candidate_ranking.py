@@ -0,0 +1,226 @@
+import re
+import unicodedata
+from functools import lru_cache
+from typing import Any, Iterable
+
+
+BRACKETS = re.compile(r"\s*(?:\([^)]*\)|\[[^\]]*\]|\{[^}]*\}|【[^】]*】|「[^」]*」|『[^』]*』)")
+SUFFIX = re.compile(
+    r"\s+-\s+[^-]*\b(?:remaster(?:ed)?|live|version|ver|edit|mix|remix|mono|stereo|instrumental|acoustic)\b.*$"
+)
+FEATURING = re.compile(r"\s+(?:feat|ft)\.?\s.*$")
+PUNCTUATION = re.compile(r"[\W_]+")
+
+KANA = {
+    "あ": "a", "い": "i", "う": "u", "え": "e", "お": "o",
+    "か": "ka", "き": "ki", "く": "ku", "け": "ke", "こ": "ko",
+    "が": "ga", "ぎ": "gi", "ぐ": "gu", "げ": "ge", "ご": "go",
+    "さ": "sa", "し": "shi", "す": "su", "せ": "se", "そ": "so",
+    "ざ": "za", "じ": "ji", "ず": "zu", "ぜ": "ze", "ぞ": "zo",
+    "た": "ta", "ち": "chi", "つ": "tsu", "て": "te", "と": "to",
+    "だ": "da", "ぢ": "ji", "づ": "zu", "で": "de", "ど": "do",
+    "な": "na", "に": "ni", "ぬ": "nu", "ね": "ne", "の": "no",
+    "は": "ha", "ひ": "hi", "ふ": "fu", "へ": "he", "ほ": "ho",
+    "ば": "ba", "び": "bi", "ぶ": "bu", "べ": "be", "ぼ": "bo",
+    "ぱ": "pa", "ぴ": "pi", "ぷ": "pu", "ぺ": "pe", "ぽ": "po",
+    "ま": "ma", "み": "mi", "む": "mu", "め": "me", "も": "mo",
+    "や": "ya", "ゆ": "yu", "よ": "yo",
+    "ら": "ra", "り": "ri", "る": "ru", "れ": "re", "ろ": "ro",
+    "わ": "wa", "ゐ": "i", "ゑ": "e", "を": "o", "ん": "n", "ゔ": "vu",
+}
+SMALL_Y = {"ゃ": "a", "ゅ": "u", "ょ": "o"}
+SMALL_VOWELS = {"ぁ": "a", "ぃ": "i", "ぅ": "u", "ぇ": "e", "ぉ": "o", "ゎ": "a"}
+
+WEIGHTS = {"title": 0.55, "artist": 0.25, "album": 0.1, "length": 0.1}
+
+# Below this confidence a candidate is not taken even as a hazy match.
+MINIMUM_CONFIDENCE = 0.6
+
+
+def romanize(text: str) -> str:
+    """
+    Transliterate the hiragana and katakana of `text` to Hepburn romaji,
+    leaving every other character alone.
+    """
+    output: list[str] = []
+    double = False
+    for char in text:
+        if "ァ" <= char <= "ヶ":
+            char = chr(ord(char) - 0x60)
+        if char in KANA:
+            romaji = KANA[char]
+            if double:
+                romaji = romaji[0] + romaji
+                double = False
+            output.append(romaji)
+        elif char in SMALL_Y and len(output) > 0 and output[-1].endswith("i"):
+            previous = output[-1][:-1]
+            output[-1] = previous + ("" if previous.endswith(("sh", "ch", "j")) else "y") + SMALL_Y[char]
+        elif char in SMALL_VOWELS and len(output) > 0 and output[-1][-1] in "aiueo":
+            # ウェ is "we", ファ "fa" and ティ "ti".
+            previous = "w" if output[-1] == "u" else output[-1][:-1]
+            output[-1] = previous + SMALL_VOWELS[char]
+        elif char in SMALL_VOWELS:
+            output.append(SMALL_VOWELS[char])
+        elif char in ("っ", "ッ"):
+            double = True
+        elif char == "ー":
+            continue
+        else:
+            output.append(char)
+    return "".join(output)
+
+
+@lru_cache(maxsize=65536)
+def normalize(text: str) -> str:
+    """
+    Normalize a title, album or artist name for comparison: fold full-width
+    characters (NFKC), casefold, strip bracketed and "- Remastered" style
+    suffixes, transliterate kana and reduce punctuation to single spaces.
+    """
+    text = unicodedata.normalize("NFKC", text).casefold()
+    stripped = FEATURING.sub("", SUFFIX.sub("", BRACKETS.sub("", text)))
+    if stripped.strip() != "":
+        text = stripped
+    if any("ぁ" <= char <= "ヿ" for char in text):
+        text = romanize(text)
+    return " ".join(PUNCTUATION.sub(" ", text).split())
+
+
+class Features:
+    """
+    The `Features` class holds what the similarity of a string is computed
+    from: its normalized form, its tokens and its character trigrams.
+    """
+
+    __slots__ = ("text", "tokens", "trigrams")
+
+    def __init__(self, text: str) -> None:
+        self.text: str = normalize(text)
+        self.tokens: frozenset[str] = frozenset(self.text.split())
+        padded = f" {self.text} "
+        self.trigrams: frozenset[str] = frozenset(padded[i:i + 3] for i in range(len(padded) - 2))
+
+    def similarity(self, other: "Features") -> float:
+        """
+        The mean of the token Jaccard index and the trigram Dice coefficient, 1 for equal strings.
+        """
+        if self.text == other.text:
+            return 1.0
+        if len(self.tokens) == 0 or len(other.tokens) == 0:
+            return 0.0
+        tokens = len(self.tokens & other.tokens) / len(self.tokens | other.tokens)
+        trigrams = 2 * len(self.trigrams & other.trigrams) / (len(self.trigrams) + len(other.trigrams))
+        return (tokens + trigrams) / 2
+
+
+@lru_cache(maxsize=65536)
+def features(text: str) -> Features:
+    return Features(text)
+
+
+class Candidate:
+    """
+    The `Candidate` class is one search result to be ranked, along with the
+    provider's own object for it in `item`.
+    """
+
+    __slots__ = ("title", "album", "artist", "length", "item")
+
+    def __init__(self, title: str, album: str, artist: list[str], length: int | None = None, item: Any = None) -> None:
+        """
+        :param title: str: The title of the song
+        :param album: str: The album of the song
+        :param artist: list[str]: The artists of the song
+        :param length: int | None: The length of the song in microseconds, if known
+        :param item: Any: The provider's object for this result
+        """
+        self.title = title
+        self.album = album
+        self.artist = artist
+        self.length = length
+        self.item = item
+
+
+class RankedCandidate:
+    __slots__ = ("candidate", "confidence", "exact")
+
+    def __init__(self, candidate: Candidate, confidence: float, exact: bool) -> None:
+        self.candidate = candidate
+        self.confidence = confidence
+        self.exact = exact
+
+    def __repr__(self) -> str:
+        return f"<candidate_ranking.RankedCandidate title='{self.candidate.title}' confidence={self.confidence:.3f} exact={self.exact}>"
+
+
+class CandidateRanker:
+    """
+    The `CandidateRanker` class scores the search results of one lookup
+    against the song being played. The song is normalized once, and the
+    features of every string seen are cached, so thousands of candidates can
+    be scored per lookup. A candidate is exact when its normalized title,
+    album and artists equal the song's and its length is within `tolerance`.
+    """
+
+    def __init__(
+        self, title: str, album: str, artist: list[str], length: int | None = None, tolerance: int = 3000000
+    ) -> None:
+        """
+        :param title: str: The title of the song
+        :param album: str: The album of the song
+        :param artist: list[str]: The artists of the song
+        :param length: int | None: The `mpris:length` of the song in microseconds, if known
+        :param tolerance: int: The largest length difference of an exact match in microseconds
+        """
+        self.__title: Features = features(title)
+        self.__album: Features = features(album)
+        self.__artist: list[Features] = [features(a) for a in artist if normalize(a) != ""]
+        self.__artist_set: frozenset[str] = frozenset(x.text for x in self.__artist)
+        self.__length: int | None = length if length is not None and length > 0 else None
+        self.__tolerance: int = tolerance
+
+    def __artist_similarity(self, artist: list[str]) -> float | None:
+        candidates = [features(a) for a in artist]
+        candidates = [x for x in candidates if x.text != ""]
+        if len(self.__artist) == 0 or len(candidates) == 0:
+            return None
+        total = 0.0
+        for wanted in self.__artist:
+            total += max(wanted.similarity(x) for x in candidates)
+        return total / len(self.__artist)
+
+    def score(self, candidate: Candidate) -> RankedCandidate:
+        title = features(candidate.title)
+        scores = {"title": self.__title.similarity(title)}
+        if self.__album.text != "" and normalize(candidate.album) != "":
+            scores["album"] = self.__album.similarity(features(candidate.album))
+        artist = self.__artist_similarity(candidate.artist)
+        if artist is not None:
+            scores["artist"] = artist
+        difference = None
+        if self.__length is not None and candidate.length is not None and candidate.length > 0:
+            difference = abs(self.__length - candidate.length)
+            scores["length"] = 1 / (1 + (difference / (2 * self.__tolerance)) ** 2)
+
+        confidence = sum(WEIGHTS[x] * scores[x] for x in scores) / sum(WEIGHTS[x] for x in scores)
+        exact = (
+            title.text == self.__title.text
+            and normalize(candidate.album) == self.__album.text
+            and frozenset(normalize(a) for a in candidate.artist) == self.__artist_set
+            and (difference is None or difference <= self.__tolerance)
+        )
+        return RankedCandidate(candidate, confidence, exact)
+
+    def rank(self, candidates: Iterable[Candidate], threshold: float = 0.0) -> list[RankedCandidate]:
+        """
+        Score candidates in a batch.
+
+        :param candidates: Iterable[Candidate]: The search results
+        :param threshold: float: The lowest confidence to keep
+        :return: The candidates of at least `threshold` confidence, best first
+        """
+        ranked = [self.score(candidate) for candidate in candidates]
+        ranked = [x for x in ranked if x.confidence >= threshold]
+        ranked.sort(key=lambda x: (x.exact, x.confidence), reverse=True)
+        return ranked
@@ -0,0 +1,55 @@
+import os
+
+try:
+    import tomllib
+except ModuleNotFoundError:
+    # `tomllib` is only in the standard library from Python 3.11 on.
+    import tomli as tomllib
+
+from loguru import logger
+
+
+# The defaults shipped along with LyriK, every key documented there.
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "lyrickrc.toml")
+
+
+def default_path() -> str:
+    config_home = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    return os.path.join(config_home, "lyrik", "lyrickrc.toml")
+
+
+def merge(base: dict[str], override: dict[str]) -> dict[str]:
+    """
+    Returns `base` with the keys of `override` laid over it, tables merged key by key.
+    """
+    merged = dict(base)
+    for (key, value) in override.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def load_config(path: str | None = None) -> dict[str]:
+    """
+    Read the configuration: the shipped `lyrickrc.toml`, overridden by the
+    user's file, `$XDG_CONFIG_HOME/lyrik/lyrickrc.toml` unless `path` is given.
+    A user's file which is missing is not an error; one which cannot be read
+    or parsed is logged and ignored, so that LyriK still starts.
+
+    :param path: str | None: The user's configuration file
+    :return: The whole configuration, by section
+    """
+    with open(DEFAULT_PATH, "rb") as file:
+        config = tomllib.load(file)
+    if path is None:
+        path = default_path()
+    try:
+        with open(path, "rb") as file:
+            config = merge(config, tomllib.load(file))
+    except FileNotFoundError:
+        pass
+    except (OSError, tomllib.TOMLDecodeError) as exception:
+        logger.critical(f"Cannot read the configuration {path}: {exception!r}")
+    return config
@@ -1,18 +1,24 @@
 import abc
 
 from dbus_next.aio import MessageBus
-from dbus_next.service import ServiceInterface, dbus_property, PropertyAccess, signal
+from dbus_next.service import ServiceInterface, dbus_property, PropertyAccess, signal, method
+from dbus_next.signature import Variant
 
 import asyncio
 
 from mpris_watcher import MprisWatcher
+from lyrics_timeline import LyricsTimeline
 from adaptor import AbstractAdaptor
+from metrics import metrics
 
 
 class DBusAdaptor(AbstractAdaptor, ServiceInterface):
     """
     The `DBusAdaptor` class is a service interface that adapts a `Core` object and provides properties
     that can be accessed through D-Bus.
+    Registered with `add_callable(adaptor.update)`, it emits `PropertiesChanged`
+    with only the properties which changed: the indexes alone while a song
+    plays, and the lyrics only along with a new `Generation`.
     """
 
     @classmethod
@@ -25,6 +31,27 @@ class DBusAdaptor(AbstractAdaptor, ServiceInterface):
         self.__bus = bus
         self.__name = name
 
+        # What the clients were last told, to send deltas against.
+        self.__generation: int = 0
+        self.__player: str = adaptee.mpris_name
+        self.__title: str = adaptee.title
+        self.__timeline: LyricsTimeline = adaptee.timeline
+        self.__translation_timelines: dict[str, LyricsTimeline] = adaptee.translation_timelines
+        self.__index: int = adaptee.index
+        self.__word_index: int = adaptee.word_index
+        self.__translations_indexes: dict[str, int] = dict(adaptee.translations_indexes)
+
+    @dbus_property(PropertyAccess.READ)
+    def Player(self) -> "s":
+        return self.__adaptee.mpris_name
+
+    @dbus_property(PropertyAccess.READ)
+    def Generation(self) -> "t":
+        """
+        Grows by one whenever the song or its lyrics change: cached lyrics of an older generation are stale.
+        """
+        return self.__generation
+
     @dbus_property(PropertyAccess.READ)
     def Title(self) -> "s":
         return self.__adaptee.title
@@ -33,10 +60,31 @@ class DBusAdaptor(AbstractAdaptor, ServiceInterface):
     def Index(self) -> "i":
         return self.__adaptee.index
 
+    @dbus_property(PropertyAccess.READ)
+    def WordIndex(self) -> "i":
+        """
+        The index of the current word within the current line, -1 before its first word or without word timing.
+        """
+        return self.__adaptee.word_index
+
     @dbus_property(PropertyAccess.READ)
     def TranslationIndexes(self) -> "a{si}":
         return self.__adaptee.translations_indexes
 
+    @dbus_property(PropertyAccess.READ)
+    def CurrentLine(self) -> "(xs)":
+        """
+        The timestamp in microseconds and the text of the current line, (-1, "") before the first one.
+        """
+        return self.__line(self.__adaptee.timeline, self.__adaptee.index)
+
+    @dbus_property(PropertyAccess.READ)
+    def CurrentWords(self) -> "a(xu)":
+        """
+        The timestamp in microseconds and the position in the text of every word of the current line.
+        """
+        return [list(x) for x in self.__adaptee.timeline.words(self.__adaptee.index)]
+
     @dbus_property(PropertyAccess.READ)
     def OriginalLyrics(self) -> "aa{is}":
         return self.__adaptee.original_lyrics
@@ -45,9 +93,110 @@ class DBusAdaptor(AbstractAdaptor, ServiceInterface):
     def Translations(self) -> "a{saa{is}}":
         return self.__adaptee.translations
     
+    @dbus_property(PropertyAccess.READ)
+    def ProviderHealth(self) -> "a{sa{sv}}":
+        health: dict[str, dict[str, Variant]] = {}
+        if self.__adaptee.interface_manager is None:
+            return health
+        for name, provider in self.__adaptee.interface_manager.health.items():
+            health[name] = {
+                "State": Variant("s", provider.state),
+                "Latency": Variant("d", provider.latency),
+                "ErrorRate": Variant("d", provider.error_rate),
+            }
+        return health
+
     @signal()
     def Updated(self) -> None:
         return
+
+    @staticmethod
+    def __line(timeline: LyricsTimeline, index: int) -> list:
+        if 0 <= index < len(timeline):
+            return list(timeline[index])
+        return [-1, ""]
+
+    @method()
+    def GetLines(self, start: "i", count: "i", languages: "as") -> "a(xs)a{sa(xs)}":
+        """
+        Returns `count` lines from index `start` on, and for each language of
+        `languages` which has a translation, the translation line aligned to
+        each of them, (-1, "") where there is none.
+        """
+        timeline = self.__adaptee.timeline
+        start = max(start, 0)
+        stop = min(start + max(count, 0), len(timeline))
+        lines = [list(x) for x in zip(timeline.timestamps[start:stop], timeline.texts[start:stop])]
+        translations: dict[str, list] = {}
+        for language in languages:
+            if language not in self.__adaptee.translation_timelines:
+                continue
+            translation = self.__adaptee.translation_timelines[language]
+            alignment = self.__adaptee.alignments[language]
+            translations[language] = [self.__line(translation, x) for x in alignment[start:stop]]
+        return [lines, translations]
+
+    @method()
+    def GetWindow(self, before: "u", after: "u") -> "ia(xs)":
+        """
+        Returns the index of the first line of the window and the lines from
+        `before` lines before the current one to `after` lines after it.
+        """
+        timeline = self.__adaptee.timeline
+        index = self.__adaptee.index
+        start = max(index - before, 0)
+        stop = min(index + after + 1, len(timeline))
+        return [start, [list(x) for x in zip(timeline.timestamps[start:stop], timeline.texts[start:stop])]]
+
+    @method()
+    def GetWords(self, index: "i") -> "a(xu)":
+        """
+        Returns the timestamp in microseconds and the position in the text of every word of the line at `index`.
+        """
+        return [list(x) for x in self.__adaptee.timeline.words(index)]
+
+    def update(self) -> None:
+        """
+        Tell the clients what changed since the last call with a single
+        `PropertiesChanged`, then emit the argument-less `Updated` for older
+        clients, unless only `WordIndex` changed.
+        """
+        changed: dict[str] = {}
+        adaptee = self.__adaptee
+        if (
+            adaptee.timeline is not self.__timeline
+            or adaptee.translation_timelines is not self.__translation_timelines
+            or adaptee.title != self.__title
+            or adaptee.mpris_name != self.__player
+        ):
+            self.__generation += 1
+            self.__player = adaptee.mpris_name
+            self.__title = adaptee.title
+            self.__timeline = adaptee.timeline
+            self.__translation_timelines = adaptee.translation_timelines
+            changed["Generation"] = self.__generation
+            changed["Player"] = self.__player
+            changed["Title"] = self.__title
+            changed["OriginalLyrics"] = adaptee.original_lyrics
+            changed["Translations"] = adaptee.translations
+        if adaptee.index != self.__index or "Generation" in changed:
+            self.__index = adaptee.index
+            changed["Index"] = self.__index
+            changed["CurrentLine"] = self.__line(adaptee.timeline, self.__index)
+            changed["CurrentWords"] = [list(x) for x in adaptee.timeline.words(self.__index)]
+        if adaptee.word_index != self.__word_index or "Index" in changed:
+            self.__word_index = adaptee.word_index
+            changed["WordIndex"] = self.__word_index
+        if adaptee.translations_indexes != self.__translations_indexes:
+            self.__translations_indexes = dict(adaptee.translations_indexes)
+            changed["TranslationIndexes"] = self.__translations_indexes
+        with metrics.timer("signal_emit"):
+            if len(changed) > 0:
+                self.emit_properties_changed(changed)
+                metrics.increment("properties_changed", value=len(changed))
+            # Older clients know nothing of words, a word alone is not worth waking them for.
+            if len(changed) != 1 or "WordIndex" not in changed:
+                self.Updated()
     
     async def create_service(self) -> None:
         self.__bus.export("/", self)
@@ -62,8 +211,8 @@ async def main():
     bus: MessageBus = await MessageBus().connect()
     core = MprisWatcher(bus, "yesplaymusic")
     adaptor = DBusAdaptor(bus,"test",core)
-    core.add_callable(adaptor.Updated())
-    asyncio.get_event_loop().create_task(core.polling())
+    core.add_callable(adaptor.update)
+    asyncio.get_event_loop().create_task(core.watch())
     bus.export("/com/test", adaptor)
     await bus.request_name("com.example.name")
     await bus.wait_for_disconnect()
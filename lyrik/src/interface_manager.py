@@ -1,21 +1,32 @@
 import asyncio
-import importlib
-import pkgutil
-from typing import Callable, Coroutine
+import inspect
+from typing import AsyncGenerator, TYPE_CHECKING
 
-from netwrok_interface import AbstractNetworkInterface, LyricsResponse, InternetError
+import time
+
+from netwrok_interface import AbstractNetworkInterface, LyricsResponse, InternetError, NoFoundError
+from lyrics_cache import LyricsCache
+from transport import AbstractTransport, HttpTransport
+from provider_health import ProviderHealth, TokenBucket
+from plugin_registry import PluginRegistry
+from metrics import metrics
 
 from loguru import logger
 
-from netease_music_interface import NeteaseMusicInterface
+if TYPE_CHECKING:
+    from trace_recorder import TraceRecorder
 
 
 class AllNoFoundError(Exception):
-    def __init__(self, title: str, album: str, artist: list, hazy_search: bool) -> None:
+    def __init__(self, title: str, album: str, artist: list, hazy_search: bool, conclusive: bool = True) -> None:
+        """
+        :param conclusive: bool: Whether every interface answered that it has no lyrics, none failing or being skipped
+        """
         self.title = title
         self.album = album
         self.artist = artist
         self.hazy_search = hazy_search
+        self.conclusive = conclusive
 
     def __str__(self) -> str:
         return f"No lyrics found for {self.title} by {self.artist} on {self.album}"
@@ -30,61 +41,522 @@ class NetworkError(Exception):
 
 
 class InterfaceManager:
-    def __init__(self, path: str | None, config: dict[str]) -> None:
-        for module in pkgutil.iter_modules(path=path):
-            if module.name.startswith("lyrik_interface"):
-                importlib.import_module(module.name)
+    # The cancellation message of the interfaces still searching when the lookup deadline is over.
+    DEADLINE_EXCEEDED = "deadline exceeded"
 
-        self.__interfaces: list[AbstractNetworkInterface] = []
-        for interface_class in AbstractNetworkInterface.__subclasses__():
-            if not interface_class.name() in config["Disabled"]:
-                self.__interfaces.append(interface_class())
+    def __init__(
+        self,
+        path: str | None,
+        config: dict[str],
+        cache: LyricsCache | None = None,
+        transport: AbstractTransport | None = None,
+        registry: PluginRegistry | None = None,
+        recorder: "TraceRecorder | None" = None,
+    ) -> None:
+        # Interfaces are only known by name here, they are imported and constructed on their first lookup.
+        self.__registry: PluginRegistry = PluginRegistry(path) if registry is None else registry
+        self.__specs: dict[str, str | type[AbstractNetworkInterface]] = {
+            name: spec
+            for (name, spec) in self.__registry.discover().items()
+            if name not in config["Disabled"] and self.__registry.configured(name, config.get(name, {}))
+        }
+        self.__config: dict[str] = config
 
-        self.__task: asyncio.Task = None
+        # Every interface shares this transport, and with it one pool of kept-alive connections.
+        self.__transport: AbstractTransport = HttpTransport() if transport is None else transport
 
+        self.__interfaces: dict[str, AbstractNetworkInterface] = {}
+        self.__load_times: dict[str, float] = {}
+
+        # An entry of `Priority` is either one interface name or a group of equally ranked ones.
         self.__weights: dict[str, int] = {}
         for item in enumerate(config["Priority"]):
-            self.__weights[item[1]] = item[0]
+            for name in [item[1]] if isinstance(item[1], str) else item[1]:
+                self.__weights[name] = item[0]
+
+        self.__health: dict[str, ProviderHealth] = {}
+        for name in self.__specs:
+            self.__health[name] = ProviderHealth(
+                failure_threshold=config.get("FailureThreshold", 3),
+                cooldown=config.get("Cooldown", 30000) / 1000,
+            )
+        self.__buckets: dict[str, TokenBucket] = {}
+        # Interfaces written before `length` was introduced do not accept it.
+        self.__takes_length: set[str] = set()
+
+        self.__timeout: float = config.get("Timeout", 5000) / 1000
+        self.__deadline: float = config.get("Deadline", 8000) / 1000
+
+        self.__cache: LyricsCache | None = cache
+        # Every answer of every interface is appended to the trace, if any.
+        self.__recorder: TraceRecorder | None = recorder
+
+        self.__in_flight: dict[str, InFlightLookup] = {}
+        self.__foreground: int = 0
+        self.__idle: asyncio.Event = asyncio.Event()
+        self.__idle.set()
+        self.__coalesced: int = 0
+
+    @property
+    def names(self) -> list[str]:
+        """
+        Returns the names of all enabled interfaces, constructed or not
+        """
+        return list(self.__specs)
 
     @property
     def interfaces(self) -> list[AbstractNetworkInterface]:
         """
-        Returns a list of all interfaces
+        Returns a list of the interfaces constructed so far
+        """
+        return list(self.__interfaces.values())
+
+    @property
+    def load_times(self) -> dict[str, float]:
+        """
+        Returns how long importing and constructing each interface took, in seconds
+        """
+        return self.__load_times
+
+    def interface(self, name: str) -> AbstractNetworkInterface:
+        """
+        Returns the interface called `name`, importing and constructing it on first use.
+        """
+        if name in self.__interfaces:
+            return self.__interfaces[name]
+        start = time.perf_counter()
+        interface_class = self.__registry.load(self.__specs[name])
+        arguments = {"transport": self.__transport, "config": self.__config.get(name, {})}
+        parameters = inspect.signature(interface_class).parameters
+        # Interfaces written before the shared transport was introduced take neither argument.
+        if not any(x.kind == inspect.Parameter.VAR_KEYWORD for x in parameters.values()):
+            arguments = {key: value for (key, value) in arguments.items() if key in parameters}
+        interface = interface_class(**arguments)
+        self.__load_times[name] = time.perf_counter() - start
+        if "length" in inspect.signature(interface.get_lyrics).parameters:
+            self.__takes_length.add(name)
+        if interface.remote:
+            self.__buckets[name] = TokenBucket(self.__config.get("RateLimit", 2), self.__config.get("Burst", 5))
+        self.__interfaces[name] = interface
+        return interface
+
+    @property
+    def cache(self) -> LyricsCache | None:
+        return self.__cache
+
+    @property
+    def transport(self) -> AbstractTransport:
+        return self.__transport
+
+    @property
+    def health(self) -> dict[str, ProviderHealth]:
+        """
+        Returns the health of every interface by name
+        """
+        return self.__health
+
+    async def close(self) -> None:
+        await self.__transport.close()
+
+    async def warm_up(self) -> None:
+        """
+        Let every interface prepare for a lookup which is likely to come soon.
+        """
+        interfaces: list[AbstractNetworkInterface] = []
+        for name in self.__specs:
+            try:
+                interfaces.append(self.interface(name))
+            except Exception as exception:
+                logger.critical(f"Cannot load {name}: {exception!r}")
+        await asyncio.gather(*(interface.warm_up() for interface in interfaces), return_exceptions=True)
+
+    def peek(self, title: str, album: str, artist: list, track_id: str | None = None) -> LyricsResponse | None:
+        """
+        Returns the cached lyrics of a song without searching, or None
+        """
+        if self.__cache is None:
+            return None
+        start = time.monotonic()
+        try:
+            # The lookup following anything but lyrics counts it.
+            response = self.__cache.lookup(LyricsCache.key(title, album, artist, track_id), peek=True)
+        except KeyError:
+            return None
+        if self.__recorder is not None:
+            self.__recorder.cache(title, album, artist, None, None, track_id, time.monotonic() - start, response)
+        return response
+
+    @property
+    def coalesced(self) -> int:
+        """
+        Returns how many lookups were served by joining an identical one already in flight
+        """
+        return self.__coalesced
+
+    def __rank(self, name: str) -> int:
+        """
+        Interfaces listed first in `Priority` rank first, unlisted ones come last.
+        """
+        return self.__weights.get(name, len(self.__weights))
+
+    def __order(self, name: str) -> tuple[int, float]:
+        """
+        Within a `Priority` group, the interface observed to be faster comes first.
+        """
+        return self.__rank(name), self.__health[name].latency
+
+    async def __call(
+        self,
+        interface: AbstractNetworkInterface,
+        title: str,
+        album: str,
+        artist: list,
+        hazy_search: bool,
+        length: int | None,
+    ) -> LyricsResponse:
+        health = self.__health[interface.name()]
+        # Waiting for a token is only bounded by the lookup deadline, not by `Timeout`.
+        if interface.name() in self.__buckets:
+            await self.__buckets[interface.name()].acquire()
+        start = time.monotonic()
+        try:
+            if interface.name() in self.__takes_length:
+                coroutine = interface.get_lyrics(title, album, artist, hazy_search, length=length)
+            else:
+                coroutine = interface.get_lyrics(title, album, artist, hazy_search)
+            result = await asyncio.wait_for(coroutine, self.__timeout)
+        except NoFoundError as exception:
+            health.record_success(time.monotonic() - start)
+            metrics.observe("interface", int((time.monotonic() - start) * 1000000), interface.name())
+            metrics.increment("search_not_found", interface.name())
+            self.__record(interface, title, album, artist, hazy_search, length, start, exception)
+            raise
+        except asyncio.CancelledError as exception:
+            # Missing the lookup deadline is a failure, losing to another interface is not.
+            if exception.args == (self.DEADLINE_EXCEEDED,):
+                health.record_failure(time.monotonic() - start)
+                metrics.increment("search_failures", interface.name())
+            else:
+                health.record_cancelled(time.monotonic() - start)
+                metrics.increment("search_cancelled", interface.name())
+            self.__record(interface, title, album, artist, hazy_search, length, start, exception)
+            raise
+        except Exception as exception:
+            health.record_failure(time.monotonic() - start)
+            metrics.increment("search_failures", interface.name())
+            self.__record(interface, title, album, artist, hazy_search, length, start, exception)
+            raise
+        health.record_success(time.monotonic() - start)
+        metrics.observe("interface", int((time.monotonic() - start) * 1000000), interface.name())
+        self.__record(interface, title, album, artist, hazy_search, length, start, result)
+        return result
+
+    def __record(
+        self,
+        interface: AbstractNetworkInterface,
+        title: str,
+        album: str,
+        artist: list,
+        hazy_search: bool,
+        length: int | None,
+        start: float,
+        response: LyricsResponse | BaseException,
+    ) -> None:
+        if self.__recorder is not None:
+            self.__recorder.response(
+                interface.name(), title, album, artist, hazy_search, length, time.monotonic() - start, response
+            )
+
+    def __join(
+        self, title: str, album: str, artist: list, hazy_search: bool, track_id: str | None, length: int | None
+    ) -> tuple[str, "InFlightLookup"]:
+        """
+        Join the lookup in flight for the same song, or start one.
+        The caller must `__leave` it afterwards.
+        """
+        key = f"{LyricsCache.key(title, album, artist)}\x1f{hazy_search}"
+        flight = self.__in_flight.get(key)
+        if flight is None:
+            flight = InFlightLookup()
+            flight.task = asyncio.ensure_future(
+                self.__lookup(flight, title, album, artist, hazy_search, track_id, length)
+            )
+            flight.task.add_done_callback(lambda _: self.__land(key, flight))
+            self.__in_flight[key] = flight
+        else:
+            self.__coalesced += 1
+        flight.waiters += 1
+        return key, flight
+
+    def __leave(self, key: str, flight: "InFlightLookup") -> None:
+        flight.waiters -= 1
+        if flight.waiters == 0 and not flight.task.done():
+            flight.task.cancel()
+            self.__land(key, flight)
+
+    def __land(self, key: str, flight: "InFlightLookup") -> None:
+        if self.__in_flight.get(key) is flight:
+            del self.__in_flight[key]
+
+    def enter_foreground(self) -> None:
+        """
+        Hold background lookups back until the matching `exit_foreground`, e.g.
+        while a foreground lookup is about to start but still debounced.
         """
-        return self.__interfaces
+        self.__foreground += 1
+        self.__idle.clear()
+
+    def exit_foreground(self) -> None:
+        self.__foreground -= 1
+        if self.__foreground == 0:
+            self.__idle.set()
 
-    async def get_lyrics(self, title: str, album: str, artist: list, hazy_search: bool) -> LyricsResponse:
-        for interface in self.__interfaces:
-            if not self.__task is None:
-                self.__task.cancel()
-            coroutines: list[Coroutine] = []
-            coroutines.append(interface.get_lyrics(title, album, artist, hazy_search))
-            result: list[LyricsResponse | Exception] = await asyncio.gather(*coroutines, return_exceptions=True)
+    async def get_lyrics(
+        self,
+        title: str,
+        album: str,
+        artist: list,
+        hazy_search: bool,
+        track_id: str | None = None,
+        background: bool = False,
+        length: int | None = None,
+    ) -> LyricsResponse:
+        """
+        Look the lyrics of a song up. Concurrent callers asking for the same
+        song share a single lookup; it is only cancelled once every one of
+        them has been cancelled. Background lookups, such as prefetches,
+        only start while no foreground lookup is running.
 
-            hazy_result: list[LyricsResponse] = []
-            concrete_result: list[LyricsResponse] = []
+        :param title: str: The title of the song
+        :param album: str: The album of the song
+        :param artist: list: The artists of the song
+        :param hazy_search: bool: Whether inexact matches are acceptable
+        :param track_id: str | None: The `xesam:url` or `mpris:trackid` of the song
+        :param background: bool: Whether to yield to foreground lookups
+        :param length: int | None: The `mpris:length` of the song in microseconds, used to rank candidates
+        :return: The chosen LyricsResponse
+        """
+        if background:
+            await self.__idle.wait()
+        else:
+            self.enter_foreground()
+        key, flight = self.__join(title, album, artist, hazy_search, track_id, length)
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            self.__leave(key, flight)
+            if not background:
+                self.exit_foreground()
 
-            error = 0
-            network_error = 0
+    async def stream_lyrics(
+        self,
+        title: str,
+        album: str,
+        artist: list,
+        hazy_search: bool,
+        track_id: str | None = None,
+        length: int | None = None,
+    ) -> AsyncGenerator[LyricsResponse, None]:
+        """
+        Look the lyrics of a song up like `get_lyrics`, but yield every
+        improving result as soon as it arrives: typically a hazy match first,
+        then the concrete one. The last result yielded is the final one.
 
-            for result_item in result:
-                if isinstance(result_item, Exception):
-                    logger.critical(f"Error while getting lyrics: {result_item}")
-                    error += 1
-                    if isinstance(result_item, InternetError):
-                        network_error += 1
+        :raises AllNoFoundError: If no interface found any lyrics
+        :raises NetworkError: If every interface failed to connect
+        """
+        self.enter_foreground()
+        key, flight = self.__join(title, album, artist, hazy_search, track_id, length)
+        try:
+            seen = 0
+            while not flight.task.done():
+                if len(flight.results) > seen:
+                    seen = len(flight.results)
+                    yield flight.results[-1]
                     continue
-                else:
-                    if result_item.hazy:
-                        hazy_result.append(result_item)
+                changed = asyncio.ensure_future(flight.changed.wait())
+                try:
+                    await asyncio.wait([flight.task, changed], return_when=asyncio.FIRST_COMPLETED)
+                finally:
+                    changed.cancel()
+            response = await asyncio.shield(flight.task)
+            if seen == 0 or flight.results[seen - 1] is not response:
+                yield response
+        finally:
+            self.__leave(key, flight)
+            self.exit_foreground()
+
+    async def __lookup(
+        self,
+        flight: "InFlightLookup",
+        title: str,
+        album: str,
+        artist: list,
+        hazy_search: bool,
+        track_id: str | None,
+        length: int | None,
+    ) -> LyricsResponse:
+        """
+        Answer from the cache when possible, otherwise search the interfaces,
+        publishing every improving result to `flight`, and remember the
+        outcome, including the absence of lyrics.
+
+        :return: The chosen LyricsResponse
+        """
+        start = time.monotonic()
+        key = LyricsCache.key(title, album, artist, track_id)
+        if self.__cache is not None:
+            try:
+                response = self.__cache.lookup(key)
+            except KeyError:
+                pass
+            else:
+                metrics.observe("lookup", int((time.monotonic() - start) * 1000000), "cache")
+                if self.__recorder is not None:
+                    self.__recorder.cache(
+                        title, album, artist, hazy_search, length, track_id, time.monotonic() - start, response
+                    )
+                if response is None:
+                    raise AllNoFoundError(title, album, artist, hazy_search)
+                if hazy_search or not response.hazy:
+                    return response
+
+        try:
+            async for response in self.__search(flight, title, album, artist, hazy_search, length):
+                flight.publish(response)
+        except AllNoFoundError as exception:
+            metrics.observe("lookup", int((time.monotonic() - start) * 1000000))
+            # An interface which failed might have had the lyrics, so only a unanimous answer is remembered.
+            if self.__cache is not None and hazy_search and exception.conclusive:
+                self.__cache.store(key, None)
+            raise
+        except NetworkError:
+            metrics.observe("lookup", int((time.monotonic() - start) * 1000000))
+            raise
+        metrics.observe("lookup", int((time.monotonic() - start) * 1000000), response.interface)
+        # A hazy match only won because an interface failed is left to be looked up again.
+        if self.__cache is not None and (not response.hazy or flight.conclusive):
+            self.__cache.store(key, response)
+        return response
+
+    async def __search(
+        self, flight: "InFlightLookup", title: str, album: str, artist: list, hazy_search: bool, length: int | None
+    ) -> AsyncGenerator[LyricsResponse, None]:
+        """
+        Query every interface at once and yield each result better than the
+        previous ones, finishing as soon as the best concrete result is known,
+        i.e. once no interface of a higher `Priority` group can still answer.
+        Hazy results are only final when no concrete result can arrive any more.
+        Each interface gets `Timeout` milliseconds, the whole lookup `Deadline`.
+        Interfaces whose circuit breaker is open are skipped, the others are
+        constructed on their first lookup. Unless every interface answered,
+        `flight.conclusive` is cleared before finishing.
+
+        :param flight: InFlightLookup: The lookup searching
+        :param title: str: The title of the song
+        :param album: str: The album of the song
+        :param artist: list: The artists of the song
+        :param hazy_search: bool: Whether inexact matches are acceptable
+        :param length: int | None: The length of the song in microseconds, if known
+        :return: An async generator of improving LyricsResponse
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.__deadline
+        tasks: dict[asyncio.Task, str] = {}
+        skipped = 0
+        for name in sorted(self.__specs, key=self.__order):
+            if not self.__health[name].allow():
+                skipped += 1
+                continue
+            try:
+                interface = self.interface(name)
+            except Exception as exception:
+                logger.critical(f"Cannot load {name}: {exception!r}")
+                self.__health[name].record_failure(0.0)
+                skipped += 1
+                continue
+            task = asyncio.ensure_future(self.__call(interface, title, album, artist, hazy_search, length))
+            tasks[task] = name
+
+        hazy_result: list[LyricsResponse] = []
+        concrete_result: list[LyricsResponse] = []
+        best: LyricsResponse | None = None
+
+        error = 0
+        network_error = 0
+        not_found = 0
+
+        pending: set[asyncio.Task] = set(tasks)
+        try:
+            while len(pending) > 0:
+                done, pending = await asyncio.wait(
+                    pending, timeout=max(deadline - loop.time(), 0), return_when=asyncio.FIRST_COMPLETED
+                )
+                if len(done) == 0:
+                    logger.critical(f"Lookup deadline exceeded, {len(pending)} interfaces did not answer")
+                    for task in pending:
+                        task.cancel(self.DEADLINE_EXCEEDED)
+                    error += len(pending)
+                    network_error += len(pending)
+                    break
+
+                for task in done:
+                    exception = task.exception()
+                    if exception is not None:
+                        logger.critical(f"Error while getting lyrics from {tasks[task]}: {exception!r}")
+                        error += 1
+                        if isinstance(exception, NoFoundError):
+                            not_found += 1
+                        elif isinstance(exception, (InternetError, asyncio.TimeoutError)):
+                            network_error += 1
+                    elif task.result().hazy:
+                        hazy_result.append(task.result())
                     else:
-                        concrete_result.append(result_item)
+                        concrete_result.append(task.result())
 
-            if len(concrete_result) > 0:
-                return max(concrete_result, key=lambda x: self.__weights[x.interface])
-            elif len(hazy_result) > 0:
-                return max(hazy_result, key=lambda x: self.__weights[x.interface])
-            elif error == len(result) and error == network_error:
+                if len(concrete_result) > 0:
+                    candidate = min(concrete_result, key=lambda x: self.__order(x.interface))
+                    if all(self.__rank(tasks[task]) >= self.__rank(candidate.interface) for task in pending):
+                        if candidate is not best:
+                            yield candidate
+                        return
+                elif len(hazy_result) > 0:
+                    candidate = min(hazy_result, key=lambda x: self.__order(x.interface))
+                else:
+                    continue
+                if candidate is not best:
+                    best = candidate
+                    yield best
+        finally:
+            for task in pending:
+                task.cancel()
+
+        flight.conclusive = skipped == 0 and error == not_found
+        if best is None:
+            if error == len(tasks) and error == network_error:
                 raise NetworkError()
-            else:
-                raise AllNoFoundError(title, album, artist, hazy_search)
+            conclusive = skipped == 0 and not_found == len(tasks) > 0
+            raise AllNoFoundError(title, album, artist, hazy_search, conclusive)
+
+
+class InFlightLookup:
+    """
+    The `InFlightLookup` class is one lookup shared by every caller asking for
+    the same song, along with the improving results it published so far.
+    """
+
+    __slots__ = ("task", "waiters", "results", "changed", "conclusive")
+
+    def __init__(self) -> None:
+        self.task: asyncio.Task | None = None
+        self.waiters: int = 0
+        self.results: list[LyricsResponse] = []
+        self.changed: asyncio.Event = asyncio.Event()
+        # Whether every interface answered, rather than failing or being skipped.
+        self.conclusive: bool = True
+
+    def publish(self, response: LyricsResponse) -> None:
+        self.results.append(response)
+        # Wake the current waiters, later ones wait on a fresh event.
+        self.changed.set()
+        self.changed = asyncio.Event()
@@ -0,0 +1,243 @@
+import asyncio
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from netwrok_interface import AbstractNetworkInterface, LyricsResponse, NoFoundError
+from transport import AbstractTransport
+from candidate_ranking import Candidate, CandidateRanker, normalize, MINIMUM_CONFIDENCE
+from metrics import metrics
+
+from loguru import logger
+
+
+TAG = re.compile(r"^\s*\[(ti|ar|al):([^\]]*)\]", re.MULTILINE | re.IGNORECASE)
+ARTIST_SEPARATOR = re.compile(r"\s*(?:/|&|,|;|、|，| feat\. | ft\. )\s*", re.IGNORECASE)
+
+# Only the head of a file is read while indexing, the ID tags live there.
+HEAD_SIZE = 4096
+
+
+def parse_lrc_file(path: str) -> tuple[str, str, str]:
+    """
+    Read the `[ti:]`, `[al:]` and `[ar:]` tags of an LRC file, falling back
+    to its file name, either `Artist - Title.lrc` or `Title.lrc`.
+    Runs in the worker processes of a rescan.
+
+    :param path: str: The path of the LRC file
+    :return: The title, album and artists of the file, artists separated by `\\x1f`
+    """
+    tags: dict[str, str] = {}
+    try:
+        with open(path, "rb") as file:
+            head = file.read(HEAD_SIZE).decode("utf-8-sig", errors="replace")
+        for match in TAG.finditer(head):
+            tags.setdefault(match.group(1).lower(), match.group(2).strip())
+    except OSError:
+        pass
+
+    stem = os.path.splitext(os.path.basename(path))[0]
+    (artist, _, title) = stem.rpartition(" - ")
+    title = tags.get("ti") or title.strip()
+    artist = tags.get("ar") or artist.strip()
+    artists = [a for a in ARTIST_SEPARATOR.split(artist) if a != ""]
+    return title, tags.get("al", ""), "\x1f".join(artists)
+
+
+class LocalLibraryInterface(AbstractNetworkInterface):
+    """
+    The `LocalLibraryInterface` class answers lookups from local `.lrc` files.
+    The files under the configured directories are indexed persistently in
+    SQLite and kept in memory keyed by normalized title, so a lookup is a
+    dictionary access and never touches the network. Hazy lookups rank the
+    files sharing a title token with the song. Rescans only parse the files
+    whose mtime or size changed, in a process pool for large trees.
+    """
+
+    remote = False
+
+    def __init__(self, transport: AbstractTransport | None = None, config: dict[str] | None = None) -> None:
+        """
+        :param transport: AbstractTransport | None: Unused, the library makes no requests
+        :param config: dict[str] | None: The `LocalLibraryInterface` section of the configuration
+        """
+        super().__init__(transport, config)
+        self.__directories: list[str] = [os.path.expanduser(x) for x in self.config.get("Directories", [])]
+        self.__workers: int | None = self.config.get("Workers")
+        self.__rescan_interval: float = self.config.get("RescanInterval", 300000) / 1000
+        self.__threshold: float = self.config.get("MinConfidence", MINIMUM_CONFIDENCE)
+
+        path = self.config.get("Path") or self.default_path()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Rescans write the index from a worker thread, one at a time.
+        self.__connection: sqlite3.Connection = sqlite3.connect(path, check_same_thread=False)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("PRAGMA synchronous=NORMAL")
+        self.__connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                mtime INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                album TEXT NOT NULL,
+                artist TEXT NOT NULL
+            )
+            """
+        )
+        self.__connection.commit()
+
+        self.__stats: dict[str, tuple[int, int]] = {}
+        self.__titles: dict[str, str] = {}
+        self.__entries: dict[str, list[Candidate]] = {}
+        self.__tokens: dict[str, set[str]] = {}
+        for (path, mtime, size, title, album, artist) in self.__connection.execute("SELECT * FROM files"):
+            self.__stats[path] = (mtime, size)
+            self.__add(path, title, album, artist)
+
+        self.__scanned_at: float | None = None
+        self.__scan_task: asyncio.Task | None = None
+        self.__lock: threading.Lock = threading.Lock()
+
+    @classmethod
+    def name(cls) -> str:
+        return "LocalLibraryInterface"
+
+    @staticmethod
+    def default_path() -> str:
+        cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        return os.path.join(cache_home, "lyrik", "library.sqlite3")
+
+    def __len__(self) -> int:
+        return len(self.__stats)
+
+    def __add(self, path: str, title: str, album: str, artist: str) -> None:
+        entry = Candidate(title, album, [a for a in artist.split("\x1f") if a != ""], None, path)
+        title = normalize(title)
+        self.__titles[path] = title
+        if title not in self.__entries:
+            self.__entries[title] = []
+            for token in title.split():
+                self.__tokens.setdefault(token, set()).add(title)
+        self.__entries[title].append(entry)
+
+    def __remove(self, path: str) -> None:
+        title = self.__titles.pop(path)
+        entries = [x for x in self.__entries[title] if x.item != path]
+        if len(entries) > 0:
+            self.__entries[title] = entries
+            return
+        del self.__entries[title]
+        for token in title.split():
+            self.__tokens[token].discard(title)
+            if len(self.__tokens[token]) == 0:
+                del self.__tokens[token]
+
+    def __walk(self) -> dict[str, tuple[int, int]]:
+        stats: dict[str, tuple[int, int]] = {}
+        stack = list(self.__directories)
+        while len(stack) > 0:
+            try:
+                with os.scandir(stack.pop()) as iterator:
+                    for item in iterator:
+                        if item.is_dir():
+                            stack.append(item.path)
+                        elif item.name.lower().endswith(".lrc"):
+                            stat = item.stat()
+                            stats[item.path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError as exception:
+                logger.critical(f"Cannot scan {exception.filename}: {exception.strerror}")
+        return stats
+
+    def __rescan(self) -> tuple[list[str], list[tuple[str, int, int, str, str, str]]]:
+        """
+        Bring the persistent index up to date with the directories. Runs in a worker thread.
+
+        :return: The removed paths and the index rows of the changed files
+        """
+        with self.__lock:
+            stats = self.__walk()
+            removed = [path for path in self.__stats if path not in stats]
+            changed = [path for (path, stat) in stats.items() if self.__stats.get(path) != stat]
+            if len(changed) < 64:
+                parsed = [parse_lrc_file(path) for path in changed]
+            else:
+                with ProcessPoolExecutor(self.__workers) as executor:
+                    parsed = list(executor.map(parse_lrc_file, changed, chunksize=64))
+
+            rows = [(path, *stats[path], *parsed[i]) for (i, path) in enumerate(changed)]
+            self.__connection.executemany("DELETE FROM files WHERE path = ?", ((path,) for path in removed))
+            self.__connection.executemany("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", rows)
+            self.__connection.commit()
+            return removed, rows
+
+    async def rescan(self) -> None:
+        """
+        Rescan the directories incrementally without blocking the event loop.
+        """
+        started = time.monotonic()
+        (removed, changed) = await asyncio.get_running_loop().run_in_executor(None, self.__rescan)
+        for path in removed:
+            self.__remove(path)
+            del self.__stats[path]
+        for (path, mtime, size, title, album, artist) in changed:
+            if path in self.__stats:
+                self.__remove(path)
+            self.__stats[path] = (mtime, size)
+            self.__add(path, title, album, artist)
+        self.__scanned_at = time.monotonic()
+        logger.info(
+            f"Indexed {len(self.__stats)} lyrics files, {len(changed)} changed and {len(removed)} removed,"
+            f" in {self.__scanned_at - started:.3f}s"
+        )
+
+    def __schedule_rescan(self) -> asyncio.Task | None:
+        if len(self.__directories) == 0:
+            return None
+        due = self.__scanned_at is None or time.monotonic() - self.__scanned_at >= self.__rescan_interval
+        if due and (self.__scan_task is None or self.__scan_task.done()):
+            self.__scan_task = asyncio.ensure_future(self.rescan())
+        return self.__scan_task
+
+    async def warm_up(self) -> None:
+        self.__schedule_rescan()
+
+    async def get_lyrics(
+        self, title: str, album: str, artist: list, hazy_search=True, length: int | None = None
+    ) -> LyricsResponse:
+        """
+        Look the song up in the index. Until the first rescan finished an
+        empty index is waited for, otherwise the rescan runs in the background.
+        """
+        task = self.__schedule_rescan()
+        if task is not None and len(self.__stats) == 0:
+            await asyncio.shield(task)
+
+        with metrics.timer("search", self.name()):
+            key = normalize(title)
+            titles = {key}
+            if hazy_search:
+                for token in key.split():
+                    titles.update(self.__tokens.get(token, ()))
+            ranker = CandidateRanker(title, album, artist, length)
+            ranked = ranker.rank(
+                (entry for x in titles for entry in self.__entries.get(x, ())),
+                self.__threshold,
+            )
+        if len(ranked) == 0 or not (ranked[0].exact or hazy_search):
+            raise NoFoundError(self, title, artist, album)
+
+        try:
+            with metrics.timer("lyric_fetch", self.name()):
+                with open(ranked[0].candidate.item, encoding="utf-8-sig", errors="replace") as file:
+                    lyrics = file.read()
+        except OSError as exception:
+            raise NoFoundError(self, title, artist, album) from exception
+        return LyricsResponse(not ranked[0].exact, lyrics, None, self.name())
+
+    def close(self) -> None:
+        self.__connection.close()
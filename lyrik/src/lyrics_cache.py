@@ -0,0 +1,164 @@
+import json
+import os
+import sqlite3
+import time
+
+from netwrok_interface import LyricsResponse
+
+
+class LyricsCache:
+    """
+    The `LyricsCache` class is a persistent SQLite cache of `LyricsResponse`
+    payloads sitting in front of the interfaces. Entries expire after a TTL,
+    the least recently used ones are evicted beyond `max_entries`, and lookups
+    which found nothing are remembered separately with a shorter TTL.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        ttl: float = 30 * 24 * 3600,
+        negative_ttl: float = 24 * 3600,
+        max_entries: int = 5000,
+    ) -> None:
+        if path is None:
+            path = self.default_path()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        self.__ttl: float = ttl
+        self.__negative_ttl: float = negative_ttl
+        self.__max_entries: int = max_entries
+
+        self.__hits: int = 0
+        self.__negative_hits: int = 0
+        self.__misses: int = 0
+
+        self.__connection: sqlite3.Connection = sqlite3.connect(path)
+        self.__connection.execute("PRAGMA journal_mode=WAL")
+        self.__connection.execute("PRAGMA synchronous=NORMAL")
+        self.__connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS lyrics (
+                key TEXT PRIMARY KEY,
+                payload TEXT,
+                stored REAL NOT NULL,
+                accessed REAL NOT NULL
+            )
+            """
+        )
+        self.__connection.execute("CREATE INDEX IF NOT EXISTS lyrics_accessed ON lyrics (accessed)")
+        self.__connection.commit()
+        self.__size: int = self.__connection.execute("SELECT COUNT(*) FROM lyrics").fetchone()[0]
+
+    @classmethod
+    def from_config(cls, config: dict[str]) -> "LyricsCache":
+        """
+        Build a cache from the `Cache` section of the configuration.
+        """
+        return cls(
+            config.get("Path"),
+            config.get("TTL", 30 * 24 * 3600),
+            config.get("NegativeTTL", 24 * 3600),
+            config.get("MaxEntries", 5000),
+        )
+
+    @staticmethod
+    def default_path() -> str:
+        cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        return os.path.join(cache_home, "lyrik", "lyrics.sqlite3")
+
+    @staticmethod
+    def key(title: str, album: str, artist: list, track_id: str | None = None) -> str:
+        """
+        Build the cache key of a track from its normalized title, album and
+        sorted artists, plus the player's track identity when there is one.
+
+        :param track_id: str | None: The `xesam:url` or `mpris:trackid` of the track
+        :return: The cache key
+        """
+        parts = [title.strip().casefold(), album.strip().casefold()]
+        parts.extend(sorted(a.strip().casefold() for a in artist))
+        parts.append(track_id or "")
+        return "\x1f".join(parts)
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def negative_hits(self) -> int:
+        return self.__negative_hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
+
+    def __len__(self) -> int:
+        return self.__size
+
+    def lookup(self, key: str, peek: bool = False) -> LyricsResponse | None:
+        """
+        Look a track up in the cache.
+
+        :param key: str: The key built by `LyricsCache.key`
+        :param peek: bool: Whether a lookup follows unless lyrics are found, which counts the miss or negative hit
+        :return: The cached response, or None if the track is known to have no lyrics
+        :raises KeyError: If the track is not cached or its entry expired
+        """
+        row = self.__connection.execute("SELECT payload, stored FROM lyrics WHERE key = ?", (key,)).fetchone()
+        now = time.time()
+        if row is not None:
+            (payload, stored) = row
+            ttl = self.__negative_ttl if payload is None else self.__ttl
+            if now - stored > ttl:
+                self.__connection.execute("DELETE FROM lyrics WHERE key = ?", (key,))
+                self.__connection.commit()
+                self.__size -= 1
+                row = None
+        if row is None:
+            if not peek:
+                self.__misses += 1
+            raise KeyError(key)
+
+        self.__connection.execute("UPDATE lyrics SET accessed = ? WHERE key = ?", (now, key))
+        self.__connection.commit()
+        if payload is None:
+            if not peek:
+                self.__negative_hits += 1
+            return None
+        self.__hits += 1
+        data = json.loads(payload)
+        return LyricsResponse(data["hazy"], data["lyrics"], data["translation"], data["interface"])
+
+    def store(self, key: str, response: LyricsResponse | None) -> None:
+        """
+        Store a response, or with None remember that the track has no lyrics.
+        """
+        payload = None
+        if response is not None:
+            payload = json.dumps(
+                {
+                    "hazy": response.hazy,
+                    "lyrics": response.lyrics,
+                    "translation": response.translation,
+                    "interface": response.interface,
+                }
+            )
+        now = time.time()
+        if self.__connection.execute("SELECT 1 FROM lyrics WHERE key = ?", (key,)).fetchone() is None:
+            self.__size += 1
+        self.__connection.execute(
+            "INSERT OR REPLACE INTO lyrics (key, payload, stored, accessed) VALUES (?, ?, ?, ?)",
+            (key, payload, now, now),
+        )
+        if self.__size > self.__max_entries:
+            self.__connection.execute(
+                "DELETE FROM lyrics WHERE key IN (SELECT key FROM lyrics ORDER BY accessed LIMIT ?)",
+                (self.__size - self.__max_entries,),
+            )
+            self.__size = self.__max_entries
+        self.__connection.commit()
+
+    def close(self) -> None:
+        self.__connection.close()
@@ -0,0 +1,802 @@
+import hashlib
+import json
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Iterable, Iterator, Sequence
+
+import pylrc
+
+from metrics import metrics
+
+
+WORD_STAMP = re.compile(r"<(\d+):(\d+(?:\.\d+)?)>")
+YRC_LINE = re.compile(r"^\[(\d+),(\d+)\]", re.MULTILINE)
+YRC_WORD = re.compile(r"\((\d+),(\d+),-?\d+\)")
+
+
+class StringTable(Sequence[str]):
+    """
+    The `StringTable` class is a read-only sequence of strings stored as one
+    UTF-8 buffer and an array of offsets into it, `offsets[i]:offsets[i + 1]`
+    being string `i`. Strings are only decoded when they are read, so that a
+    table over a memory-mapped file costs nothing to load.
+    """
+
+    __slots__ = ("__offsets", "__data")
+
+    def __init__(self, offsets: Sequence[int], data: memoryview | bytes) -> None:
+        """
+        :param offsets: Sequence[int]: One more offset than there are strings
+        :param data: memoryview | bytes: The UTF-8 encoded strings, back to back
+        """
+        self.__offsets: Sequence[int] = offsets
+        self.__data: memoryview = memoryview(data)
+
+    @property
+    def nbytes(self) -> int:
+        if len(self.__offsets) == 0:
+            return 0
+        return self.__offsets[-1] - self.__offsets[0]
+
+    def __len__(self) -> int:
+        return max(len(self.__offsets) - 1, 0)
+
+    def __getitem__(self, item: int | slice) -> "str | StringTable":
+        if isinstance(item, slice):
+            (start, stop, step) = item.indices(len(self))
+            if step == 1:
+                return StringTable(self.__offsets[start:max(stop, start) + 1], self.__data)
+            return StringTable(*encode_strings([self[i] for i in range(start, stop, step)]))
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("string table index out of range")
+        return str(self.__data[self.__offsets[item]:self.__offsets[item + 1]], "utf-8", "surrogatepass")
+
+    def __repr__(self) -> str:
+        return f"<lyrics_timeline.StringTable strings={len(self)}>"
+
+
+def encode_strings(strings: Iterable[str]) -> tuple[array, bytes]:
+    """
+    Returns the offsets and the UTF-8 buffer of a `StringTable` holding `strings`.
+    """
+    offsets = array("I", [0])
+    chunks: list[bytes] = []
+    size = 0
+    for string in strings:
+        chunk = string.encode("utf-8", "surrogatepass")
+        chunks.append(chunk)
+        size += len(chunk)
+        offsets.append(size)
+    return offsets, b"".join(chunks)
+
+
+class LyricsTimeline:
+    """
+    The `LyricsTimeline` class stores the lines of one lyrics track as a sorted
+    array of int64 microsecond timestamps alongside a tuple of texts.
+    Word timing, when the lyrics have it, is stored flat in compressed sparse
+    row layout: the words of line `i` are `word_offsets[i]:word_offsets[i + 1]`
+    of `word_timestamps`, their start in microseconds, and `word_positions`,
+    where they start in the text of the line. Without word timing
+    `word_offsets` is empty.
+    The arrays may also be `memoryview`s and the texts a `StringTable`, as
+    loaded from `ParsedLyrics.from_buffer`; they are kept as they are.
+    """
+
+    __slots__ = ("__timestamps", "__texts", "__word_offsets", "__word_timestamps", "__word_positions")
+
+    def __init__(
+        self,
+        timestamps: Iterable[int] = (),
+        texts: Iterable[str] = (),
+        word_offsets: Iterable[int] = (),
+        word_timestamps: Iterable[int] = (),
+        word_positions: Iterable[int] = (),
+    ) -> None:
+        self.__timestamps: array | memoryview = self.__array("q", timestamps)
+        self.__texts: Sequence[str] = texts if isinstance(texts, StringTable) else tuple(texts)
+        if len(self.__timestamps) != len(self.__texts):
+            raise ValueError("timestamps and texts must have the same length")
+        self.__word_offsets: array | memoryview = self.__array("I", word_offsets)
+        self.__word_timestamps: array | memoryview = self.__array("q", word_timestamps)
+        self.__word_positions: array | memoryview = self.__array("I", word_positions)
+        if len(self.__word_offsets) > 0 and (
+            len(self.__word_offsets) != len(self.__texts) + 1
+            or len(self.__word_timestamps) != self.__word_offsets[-1]
+            or len(self.__word_positions) != self.__word_offsets[-1]
+        ):
+            raise ValueError("word offsets must hold one row per line and index the word arrays")
+
+    @staticmethod
+    def __array(typecode: str, values: Iterable[int]) -> array | memoryview:
+        if isinstance(values, memoryview) and values.format == typecode:
+            return values
+        return array(typecode, values)
+
+    @classmethod
+    def __from_lines(cls, lines: list[tuple[int, str, list[tuple[int, int]]]]) -> "LyricsTimeline":
+        """
+        Build a timeline from (timestamp, text, [(word timestamp, word position)]) lines.
+        """
+        word_offsets = array("I", [0])
+        word_timestamps = array("q")
+        word_positions = array("I")
+        for (_, _, words) in lines:
+            for (timestamp, position) in words:
+                word_timestamps.append(timestamp)
+                word_positions.append(position)
+            word_offsets.append(len(word_timestamps))
+        if len(word_timestamps) == 0:
+            word_offsets = array("I")
+        return cls((x[0] for x in lines), (x[1] for x in lines), word_offsets, word_timestamps, word_positions)
+
+    @staticmethod
+    def __split_words(timestamp: int, text: str) -> tuple[str, list[tuple[int, int]]]:
+        """
+        Strip the enhanced LRC `<mm:ss.xx>` stamps from a line.
+
+        :return: The plain text and the (timestamp, position) of every stamped word
+        """
+        plain: list[str] = []
+        words: list[tuple[int, int]] = []
+        length = 0
+        end = 0
+        for match in WORD_STAMP.finditer(text):
+            if match.start() > end:
+                if len(words) == 0:
+                    words.append((timestamp, 0))
+                plain.append(text[end:match.start()])
+                length += match.start() - end
+            end = match.end()
+            if end < len(text) and not text.startswith("<", end):
+                words.append((int(match.group(1)) * 60000000 + round(float(match.group(2)) * 1000000), length))
+        plain.append(text[end:])
+        return "".join(plain), words
+
+    @classmethod
+    def parse(cls, lrc: str) -> "LyricsTimeline":
+        """
+        Parse a LRC document into a timeline. `pylrc` already returns the
+        lines sorted by time, so no extra sort is needed. Enhanced LRC word
+        stamps are kept as word timing, and Netease `yrc` documents are
+        recognised and parsed with `parse_yrc`.
+
+        :param lrc: str: The LRC document
+        :return: The parsed timeline
+        """
+        if YRC_LINE.search(lrc) is not None:
+            return cls.parse_yrc(lrc)
+        lines = pylrc.parse(lrc)
+        if "<" not in lrc:
+            return cls((int(line.time * 1000000) for line in lines), (line.text for line in lines))
+        parsed = []
+        for line in lines:
+            timestamp = int(line.time * 1000000)
+            (text, words) = cls.__split_words(timestamp, line.text)
+            parsed.append((timestamp, text, words))
+        return cls.__from_lines(parsed)
+
+    @classmethod
+    def parse_yrc(cls, yrc: str) -> "LyricsTimeline":
+        """
+        Parse a Netease `yrc` document, whose lines look like
+        `[start,duration](start,duration,0)word(start,duration,0)word` in
+        milliseconds, with credits as `{"t": start, "c": [{"tx": text}]}` lines.
+
+        :param yrc: str: The yrc document
+        :return: The parsed timeline, with word timing
+        """
+        lines: list[tuple[int, str, list[tuple[int, int]]]] = []
+        for line in yrc.splitlines():
+            line = line.strip()
+            if line.startswith("{"):
+                try:
+                    credit = json.loads(line)
+                    lines.append((int(credit["t"]) * 1000, "".join(x["tx"] for x in credit["c"]), []))
+                except (ValueError, KeyError, TypeError):
+                    pass
+                continue
+            match = YRC_LINE.match(line)
+            if match is None:
+                continue
+            parts = YRC_WORD.split(line[match.end():])
+            # `split` alternates the text before the first word with (start, duration, text) triples.
+            text = parts[0]
+            words: list[tuple[int, int]] = []
+            for i in range(1, len(parts), 3):
+                words.append((int(parts[i]) * 1000, len(text)))
+                text += parts[i + 2]
+            lines.append((int(match.group(1)) * 1000, text, words))
+        lines.sort(key=lambda x: x[0])
+        return cls.__from_lines(lines)
+
+    @property
+    def timestamps(self) -> array | memoryview:
+        return self.__timestamps
+
+    @property
+    def texts(self) -> Sequence[str]:
+        return self.__texts
+
+    def __len__(self) -> int:
+        return len(self.__texts)
+
+    def __iter__(self) -> Iterator[tuple[int, str]]:
+        return zip(self.__timestamps, self.__texts)
+
+    @property
+    def word_offsets(self) -> array | memoryview:
+        return self.__word_offsets
+
+    @property
+    def word_timestamps(self) -> array | memoryview:
+        return self.__word_timestamps
+
+    @property
+    def word_positions(self) -> array | memoryview:
+        return self.__word_positions
+
+    @property
+    def has_words(self) -> bool:
+        return len(self.__word_offsets) > 0
+
+    def words(self, index: int) -> list[tuple[int, int]]:
+        """
+        Returns the (timestamp, position in the text) of every word of the line at `index`.
+        """
+        if not self.has_words or not 0 <= index < len(self.__texts):
+            return []
+        (start, end) = (self.__word_offsets[index], self.__word_offsets[index + 1])
+        return list(zip(self.__word_timestamps[start:end], self.__word_positions[start:end]))
+
+    def __getitem__(self, item: int | slice) -> "tuple[int, str] | LyricsTimeline":
+        if isinstance(item, slice):
+            if not self.has_words:
+                return LyricsTimeline(self.__timestamps[item], self.__texts[item])
+            indexes = range(len(self.__texts))[item]
+            word_offsets = array("I", [0])
+            word_timestamps = array("q")
+            word_positions = array("I")
+            for i in indexes:
+                (start, end) = (self.__word_offsets[i], self.__word_offsets[i + 1])
+                word_timestamps.extend(self.__word_timestamps[start:end])
+                word_positions.extend(self.__word_positions[start:end])
+                word_offsets.append(len(word_timestamps))
+            return LyricsTimeline(
+                self.__timestamps[item], self.__texts[item], word_offsets, word_timestamps, word_positions
+            )
+        return self.__timestamps[item], self.__texts[item]
+
+    def __repr__(self) -> str:
+        return f"<lyrics_timeline.LyricsTimeline lines={len(self)}>"
+
+    def index_at(self, position: int) -> int:
+        """
+        Find the line playing at `position` in O(log n).
+
+        :param position: int: The position in microseconds
+        :return: The index of the line, or -1 before the first line
+        """
+        return bisect_right(self.__timestamps, position) - 1
+
+    def between(self, start: int, end: int) -> "LyricsTimeline":
+        """
+        Slice out the lines starting in [start, end).
+
+        :param start: int: The start position in microseconds
+        :param end: int: The end position in microseconds
+        :return: A new timeline holding these lines
+        """
+        return self[bisect_left(self.__timestamps, start):bisect_left(self.__timestamps, end)]
+
+    def cursor(self) -> "TimelineCursor":
+        return TimelineCursor(self)
+
+    def word_cursor(self) -> "WordCursor":
+        return WordCursor(self)
+
+    def size(self) -> int:
+        """
+        Estimate the memory held by the timeline in bytes.
+        """
+        if isinstance(self.__texts, StringTable):
+            texts = self.__texts.nbytes
+        else:
+            texts = sum(len(text) for text in self.__texts)
+        return (
+            self.__timestamps.itemsize * len(self.__timestamps)
+            + texts
+            + self.__word_offsets.itemsize * len(self.__word_offsets)
+            + self.__word_timestamps.itemsize * len(self.__word_timestamps)
+            + self.__word_positions.itemsize * len(self.__word_positions)
+        )
+
+    def to_list(self) -> list[dict[int:str]]:
+        """
+        Convert the timeline into the `aa{is}` shape exposed on D-Bus.
+        """
+        return [{timestamp: text} for timestamp, text in self]
+
+
+class TimelineCursor:
+    """
+    The `TimelineCursor` class follows the playback position through a
+    timeline. Moving forward to the next line is O(1); any jump backwards or
+    past the next line falls back to a binary search.
+    """
+
+    __slots__ = ("__timeline", "__index")
+
+    def __init__(self, timeline: LyricsTimeline) -> None:
+        self.__timeline: LyricsTimeline = timeline
+        self.__index: int = -1
+
+    @property
+    def index(self) -> int:
+        return self.__index
+
+    @property
+    def next_timestamp(self) -> int | None:
+        """
+        The timestamp at which the next line starts, or None after the last line.
+        """
+        if self.__index + 1 < len(self.__timeline):
+            return self.__timeline.timestamps[self.__index + 1]
+        return None
+
+    def seek(self, position: int) -> int:
+        self.__index = self.__timeline.index_at(position)
+        return self.__index
+
+    def advance(self, position: int) -> int:
+        """
+        Move the cursor to the line playing at `position`.
+
+        :param position: int: The position in microseconds
+        :return: The new index
+        """
+        timestamps = self.__timeline.timestamps
+        index = self.__index
+        if index >= 0 and position < timestamps[index]:
+            return self.seek(position)
+        if index + 1 < len(timestamps) and position >= timestamps[index + 1]:
+            if index + 2 < len(timestamps) and position >= timestamps[index + 2]:
+                return self.seek(position)
+            self.__index = index + 1
+        return self.__index
+
+
+class WordCursor:
+    """
+    The `WordCursor` class follows the playback position through the words
+    of the current line, the way `TimelineCursor` does through the lines:
+    moving forward to the next word is O(1), anything else is a binary
+    search within the line.
+    """
+
+    __slots__ = ("__timeline", "__line", "__start", "__end", "__index")
+
+    def __init__(self, timeline: LyricsTimeline) -> None:
+        self.__timeline: LyricsTimeline = timeline
+        self.__line: int = -1
+        self.__start: int = 0
+        self.__end: int = 0
+        # The index of the current word in the flat word arrays, `start - 1` before the first word.
+        self.__index: int = -1
+
+    @property
+    def index(self) -> int:
+        """
+        The index of the current word within its line, or -1.
+        """
+        return self.__index - self.__start if self.__index >= self.__start else -1
+
+    @property
+    def next_timestamp(self) -> int | None:
+        """
+        The timestamp at which the next word of the line starts, or None after its last word.
+        """
+        if self.__index + 1 < self.__end:
+            return self.__timeline.word_timestamps[self.__index + 1]
+        return None
+
+    def advance(self, line: int, position: int) -> int:
+        """
+        Move the cursor to the word playing at `position` in the line at `line`.
+
+        :param line: int: The index of the current line, as found by a `TimelineCursor`
+        :param position: int: The position in microseconds
+        :return: The index of the word within the line, or -1
+        """
+        timeline = self.__timeline
+        if not timeline.has_words:
+            return -1
+        timestamps = timeline.word_timestamps
+        if line != self.__line:
+            self.__line = line
+            if line < 0:
+                (self.__start, self.__end) = (0, 0)
+            else:
+                (self.__start, self.__end) = (timeline.word_offsets[line], timeline.word_offsets[line + 1])
+            self.__index = bisect_right(timestamps, position, self.__start, self.__end) - 1
+            return self.index
+        index = self.__index
+        if index >= self.__start and position < timestamps[index]:
+            self.__index = bisect_right(timestamps, position, self.__start, self.__end) - 1
+        elif index + 1 < self.__end and position >= timestamps[index + 1]:
+            if index + 2 < self.__end and position >= timestamps[index + 2]:
+                self.__index = bisect_right(timestamps, position, self.__start, self.__end) - 1
+            else:
+                self.__index = index + 1
+        return self.index
+
+
+def align(original: LyricsTimeline, translation: LyricsTimeline, tolerance: int) -> array:
+    """
+    Align a translation track to the original timeline with a single merge-join
+    by timestamp. Each original line is paired with the nearest unused
+    translation line starting within `tolerance` of it.
+
+    :param original: LyricsTimeline: The original lyrics
+    :param translation: LyricsTimeline: The translated lyrics
+    :param tolerance: int: The maximum distance between paired timestamps in microseconds
+    :return: An array mapping every original index to a translation index, or -1
+    """
+    mapping = array("q", [-1]) * len(original)
+    timestamps = translation.timestamps
+    j = 0
+    for i, timestamp in enumerate(original.timestamps):
+        while j < len(timestamps) and timestamps[j] < timestamp - tolerance:
+            j += 1
+        if j == len(timestamps):
+            break
+        if timestamps[j] > timestamp + tolerance:
+            continue
+        while j + 1 < len(timestamps) and abs(timestamps[j + 1] - timestamp) < abs(timestamps[j] - timestamp):
+            j += 1
+        # Leave the translation line to the next original line if that one is closer.
+        if i + 1 < len(original) and abs(original.timestamps[i + 1] - timestamps[j]) < abs(timestamps[j] - timestamp):
+            continue
+        mapping[i] = j
+        j += 1
+    return mapping
+
+
+class ParsedLyrics:
+    """
+    The `ParsedLyrics` class holds a fully parsed song: the original timeline,
+    the translation timelines and their alignment to the original.
+
+    `to_bytes` encodes it in a versioned binary format, which `from_buffer`
+    loads without copying, e.g. from a memory-mapped file. All integers are
+    little-endian and every section starts on an 8-byte boundary:
+
+    - header: magic `LYRK`, version u16, flags u16 (none yet), lines u32, words u32, translations u32, strings u32;
+    - the number of lines of every translation, u32 each, then the number of their words, u32 each;
+    - the original timestamps, then those of every translation, in microseconds, i64 each;
+    - the alignment of every translation, one i32 translation index or -1 per original line;
+    - for the original and then every translation with word timing, the word timestamps (i64),
+      row offsets (u32, lines + 1) and positions (u32);
+    - the string table: `strings + 1` u32 offsets, then the UTF-8 data. It holds the
+      original lines, the lines of every translation and the language names, in that order.
+    """
+
+    __slots__ = ("__original", "__translations", "__alignments")
+
+    MAGIC = b"LYRK"
+    VERSION = 2
+    HEADER = struct.Struct("<4sHHIIII")
+
+    def __init__(
+        self,
+        original: LyricsTimeline,
+        translations: dict[str, LyricsTimeline],
+        alignments: dict[str, array | memoryview],
+    ) -> None:
+        self.__original: LyricsTimeline = original
+        self.__translations: dict[str, LyricsTimeline] = translations
+        self.__alignments: dict[str, array | memoryview] = alignments
+
+    @classmethod
+    def parse(cls, lyrics: str, translation: dict[str, str] | None, tolerance: int) -> "ParsedLyrics":
+        with metrics.timer("parse"):
+            original = LyricsTimeline.parse(lyrics)
+            translations: dict[str, LyricsTimeline] = {}
+            if translation is not None:
+                for language, lrc in translation.items():
+                    translations[language] = LyricsTimeline.parse(lrc)
+        alignments: dict[str, array] = {}
+        if len(translations) > 0:
+            with metrics.timer("align"):
+                alignments = {
+                    language: align(original, timeline, tolerance) for language, timeline in translations.items()
+                }
+        return cls(original, translations, alignments)
+
+    @staticmethod
+    def __pack(typecode: str, values: Iterable[int]) -> bytes:
+        packed = array(typecode, values)
+        if sys.byteorder != "little":
+            packed.byteswap()
+        return packed.tobytes()
+
+    def to_bytes(self) -> bytes:
+        """
+        Encode the parsed lyrics in the binary format described above.
+        """
+        original = self.__original
+        languages = list(self.__translations)
+        translations = [self.__translations[language] for language in languages]
+        strings: list[str] = list(original.texts)
+        for timeline in translations:
+            strings.extend(timeline.texts)
+        strings.extend(languages)
+        (string_offsets, string_data) = encode_strings(strings)
+
+        sections = [
+            self.HEADER.pack(
+                self.MAGIC,
+                self.VERSION,
+                0,
+                len(original),
+                len(original.word_timestamps),
+                len(languages),
+                len(strings),
+            ),
+            self.__pack("I", (len(timeline) for timeline in translations)),
+            self.__pack("I", (len(timeline.word_timestamps) for timeline in translations)),
+            self.__pack("q", original.timestamps),
+        ]
+        sections.extend(self.__pack("q", timeline.timestamps) for timeline in translations)
+        sections.extend(self.__pack("i", self.__alignments[language]) for language in languages)
+        for timeline in [original, *translations]:
+            if len(timeline.word_timestamps) > 0:
+                sections.append(self.__pack("q", timeline.word_timestamps))
+                sections.append(self.__pack("I", timeline.word_offsets))
+                sections.append(self.__pack("I", timeline.word_positions))
+        sections.append(self.__pack("I", string_offsets))
+        sections.append(string_data)
+
+        encoded = bytearray()
+        for section in sections:
+            encoded += section
+            encoded += bytes(-len(encoded) % 8)
+        return bytes(encoded)
+
+    @classmethod
+    def from_buffer(cls, buffer: bytes | bytearray | memoryview | mmap.mmap) -> "ParsedLyrics":
+        """
+        Load parsed lyrics encoded by `to_bytes`. The arrays and the strings
+        are views into `buffer`, which must stay unchanged while they are used;
+        strings are only decoded when read.
+
+        :raises ValueError: If the buffer is not in this version of the format, or is truncated
+        """
+        view = memoryview(buffer).cast("B")
+        if view.nbytes < cls.HEADER.size:
+            raise ValueError("truncated lyrics buffer")
+        (magic, version, _, lines, words, count, strings) = cls.HEADER.unpack_from(view)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError(f"not a version {cls.VERSION} lyrics buffer")
+        offset = cls.HEADER.size + -cls.HEADER.size % 8
+
+        def take(typecode: str, length: int) -> array | memoryview:
+            nonlocal offset
+            size = length * struct.calcsize(typecode)
+            if offset + size > view.nbytes:
+                raise ValueError("truncated lyrics buffer")
+            section = view[offset:offset + size]
+            offset += size + -size % 8
+            if sys.byteorder != "little":
+                swapped = array(typecode, section.tobytes())
+                swapped.byteswap()
+                return swapped
+            return section.cast(typecode)
+
+        sizes = take("I", count)
+        word_counts = take("I", count)
+        timestamps = take("q", lines)
+        translation_timestamps = [take("q", size) for size in sizes]
+        alignments = [take("i", lines) for _ in range(count)]
+        # The word offsets, timestamps and positions of the original and of every translation.
+        word_arrays: list[tuple] = []
+        for (size, length) in [(lines, words), *zip(sizes, word_counts)]:
+            if length > 0:
+                word_timestamps = take("q", length)
+                word_arrays.append((take("I", size + 1), word_timestamps, take("I", length)))
+            else:
+                word_arrays.append(((), (), ()))
+        string_offsets = take("I", strings + 1)
+        if offset + string_offsets[-1] > view.nbytes:
+            raise ValueError("truncated lyrics buffer")
+        table = StringTable(string_offsets, view[offset:offset + string_offsets[-1]])
+
+        original = LyricsTimeline(timestamps, table[0:lines], *word_arrays[0])
+        languages = table[strings - count:strings]
+        translations: dict[str, LyricsTimeline] = {}
+        start = lines
+        for (language, size, timeline_timestamps, arrays) in zip(
+            languages, sizes, translation_timestamps, word_arrays[1:]
+        ):
+            translations[language] = LyricsTimeline(timeline_timestamps, table[start:start + size], *arrays)
+            start += size
+        return cls(original, translations, dict(zip(languages, alignments)))
+
+    @property
+    def original(self) -> LyricsTimeline:
+        return self.__original
+
+    @property
+    def translations(self) -> dict[str, LyricsTimeline]:
+        return self.__translations
+
+    @property
+    def alignments(self) -> dict[str, array | memoryview]:
+        return self.__alignments
+
+    def size(self) -> int:
+        size = self.__original.size()
+        for language, timeline in self.__translations.items():
+            size += timeline.size() + self.__alignments[language].itemsize * len(self.__alignments[language])
+        return size
+
+
+class ParsedLyricsCache:
+    """
+    The `ParsedLyricsCache` class is an in-process LRU of `ParsedLyrics`, keyed by
+    a hash of the raw lyrics and bounded by the estimated size of its entries.
+    With a `path`, it is backed by a directory of files in the `ParsedLyrics`
+    binary format: a song parsed once is loaded afterwards, in this process
+    or the next, by memory-mapping its file. The least recently used files
+    are removed beyond `max_files`.
+    """
+
+    def __init__(self, max_size: int = 8 * 1024 * 1024, path: str | None = None, max_files: int = 2000) -> None:
+        """
+        :param max_size: int: The estimated size of the entries kept in memory, in bytes
+        :param path: str | None: The directory of the parsed files, memory only if None
+        :param max_files: int: The number of parsed files kept in `path`
+        """
+        self.__max_size: int = max_size
+        self.__size: int = 0
+        self.__entries: OrderedDict[bytes, ParsedLyrics] = OrderedDict()
+        self.__hits: int = 0
+        self.__disk_hits: int = 0
+        self.__misses: int = 0
+
+        self.__path: str | None = path
+        self.__max_files: int = max_files
+        # Counted on the first write.
+        self.__files: int | None = None
+
+    @staticmethod
+    def default_path() -> str:
+        cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        return os.path.join(cache_home, "lyrik", "parsed")
+
+    @staticmethod
+    def key(lyrics: str, translation: dict[str, str] | None, tolerance: int) -> bytes:
+        digest = hashlib.blake2b(digest_size=16)
+        digest.update(str(tolerance).encode())
+        digest.update(b"\0")
+        digest.update(lyrics.encode("utf-8", "surrogatepass"))
+        if translation is not None:
+            for language in sorted(translation):
+                digest.update(b"\0")
+                digest.update(language.encode("utf-8", "surrogatepass"))
+                digest.update(b"\0")
+                digest.update(translation[language].encode("utf-8", "surrogatepass"))
+        return digest.digest()
+
+    @property
+    def hits(self) -> int:
+        return self.__hits
+
+    @property
+    def disk_hits(self) -> int:
+        return self.__disk_hits
+
+    @property
+    def misses(self) -> int:
+        return self.__misses
+
+    @property
+    def size(self) -> int:
+        return self.__size
+
+    def __len__(self) -> int:
+        return len(self.__entries)
+
+    def __file(self, key: bytes) -> str:
+        return os.path.join(self.__path, f"{key.hex()}.lyrk")
+
+    def __read(self, key: bytes) -> ParsedLyrics | None:
+        if self.__path is None:
+            return None
+        try:
+            with open(self.__file(key), "rb") as file:
+                with metrics.timer("load"):
+                    buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+                    parsed = ParsedLyrics.from_buffer(buffer)
+            # The modification time orders the files for removal.
+            os.utime(self.__file(key))
+        except (OSError, ValueError, struct.error):
+            return None
+        return parsed
+
+    def __write(self, key: bytes, parsed: ParsedLyrics) -> None:
+        if self.__path is None:
+            return
+        try:
+            if self.__files is None:
+                os.makedirs(self.__path, exist_ok=True)
+                self.__files = sum(1 for entry in os.scandir(self.__path) if entry.name.endswith(".lyrk"))
+            with open(f"{self.__file(key)}.tmp", "wb") as file:
+                file.write(parsed.to_bytes())
+            os.replace(f"{self.__file(key)}.tmp", self.__file(key))
+            self.__files += 1
+            if self.__files > self.__max_files:
+                self.__prune()
+        except OSError:
+            pass
+
+    def __prune(self) -> None:
+        """
+        Remove the least recently used tenth of the files, so that pruning is rare.
+        """
+        entries = sorted(
+            (entry for entry in os.scandir(self.__path) if entry.name.endswith(".lyrk")),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        remove = len(entries) - self.__max_files * 9 // 10
+        for entry in entries[:max(remove, 0)]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+        self.__files = len(entries) - max(remove, 0)
+
+    def load(self, lyrics: str, translation: dict[str, str] | None, tolerance: int) -> ParsedLyrics:
+        """
+        Return the parsed and aligned lyrics, loading them from `path` or
+        parsing them only on a miss.
+
+        :param lyrics: str: The original LRC document
+        :param translation: dict[str, str] | None: The translated LRC documents by language
+        :param tolerance: int: The alignment tolerance in microseconds
+        :return: The parsed lyrics
+        """
+        key = self.key(lyrics, translation, tolerance)
+        parsed = self.__entries.get(key)
+        if parsed is not None:
+            self.__hits += 1
+            self.__entries.move_to_end(key)
+            return parsed
+
+        parsed = self.__read(key)
+        if parsed is not None:
+            self.__disk_hits += 1
+        else:
+            self.__misses += 1
+            parsed = ParsedLyrics.parse(lyrics, translation, tolerance)
+            self.__write(key, parsed)
+        size = parsed.size()
+        if size > self.__max_size:
+            return parsed
+        self.__entries[key] = parsed
+        self.__size += size
+        while self.__size > self.__max_size:
+            (_, evicted) = self.__entries.popitem(last=False)
+            self.__size -= evicted.size()
+        return parsed
+
+
+parsed_lyrics_cache: ParsedLyricsCache = ParsedLyricsCache(path=ParsedLyricsCache.default_path())
@@ -0,0 +1,39 @@
+import time
+
+# Timed from here, before anything but the D-Bus client is imported.
+started = time.perf_counter()
+
+import argparse
+import asyncio
+
+from dbus_next.aio import MessageBus
+
+
+async def main(config_path: str | None = None):
+    bus: MessageBus = await MessageBus().connect()
+    # Claim the name before the rest of LyriK is imported, the interfaces are discovered and the cache is opened,
+    # so that activated clients wait as little as possible.
+    await bus.request_name("org.LyriK")
+    claimed = time.perf_counter()
+
+    from config import load_config
+    from player_supervisor import PlayerSupervisor
+
+    from loguru import logger
+
+    logger.info(f"Claimed org.LyriK {(claimed - started) * 1000:.1f} ms after start")
+    supervisor = PlayerSupervisor(bus, load_config(config_path))
+    logger.info(f"Ready {(time.perf_counter() - started) * 1000:.1f} ms after start")
+    try:
+        await supervisor.run()
+    finally:
+        await supervisor.interface_manager.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Provide lyrics service through D-Bus.")
+    parser.add_argument(
+        "--config", default=None, help="the configuration file, $XDG_CONFIG_HOME/lyrik/lyrickrc.toml by default"
+    )
+    options = parser.parse_args()
+    asyncio.get_event_loop().run_until_complete(main(options.config))
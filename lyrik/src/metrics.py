@@ -0,0 +1,254 @@
+import time
+from array import array
+
+
+class Histogram:
+    """
+    The `Histogram` class is an HDR-style latency histogram: values in
+    microseconds fall into log-linear buckets, `SUB_BUCKETS` per power of two,
+    so that every value is recorded within 1 / `SUB_BUCKETS` of its magnitude
+    in constant time and memory, from 1 µs up to about 12 days.
+    """
+
+    __slots__ = ("__counts", "__count", "__sum", "__min", "__max")
+
+    SUB_BITS = 3
+    SUB_BUCKETS = 1 << SUB_BITS
+    MAX_BITS = 40
+    MAX_VALUE = (1 << MAX_BITS) - 1
+    SIZE = 2 * SUB_BUCKETS + (MAX_BITS - SUB_BITS - 1) * SUB_BUCKETS
+
+    def __init__(self) -> None:
+        self.__counts: array = array("Q", [0]) * self.SIZE
+        self.__count: int = 0
+        self.__sum: int = 0
+        self.__min: int = 0
+        self.__max: int = 0
+
+    @classmethod
+    def bucket(cls, value: int) -> int:
+        """
+        Returns the index of the bucket `value` falls into.
+        """
+        if value < 2 * cls.SUB_BUCKETS:
+            return value
+        shift = value.bit_length() - cls.SUB_BITS - 1
+        return 2 * cls.SUB_BUCKETS + (shift - 1) * cls.SUB_BUCKETS + (value >> shift) - cls.SUB_BUCKETS
+
+    @classmethod
+    def bounds(cls, index: int) -> tuple[int, int]:
+        """
+        Returns the lowest and the highest value of the bucket at `index`.
+        """
+        if index < 2 * cls.SUB_BUCKETS:
+            return index, index
+        (shift, top) = divmod(index - 2 * cls.SUB_BUCKETS, cls.SUB_BUCKETS)
+        shift += 1
+        top += cls.SUB_BUCKETS
+        return top << shift, ((top + 1) << shift) - 1
+
+    def record(self, value: int) -> None:
+        """
+        :param value: int: The latency in microseconds, clamped to [0, `MAX_VALUE`]
+        """
+        value = min(max(value, 0), self.MAX_VALUE)
+        self.__counts[self.bucket(value)] += 1
+        if self.__count == 0 or value < self.__min:
+            self.__min = value
+        if value > self.__max:
+            self.__max = value
+        self.__count += 1
+        self.__sum += value
+
+    @property
+    def count(self) -> int:
+        return self.__count
+
+    @property
+    def sum(self) -> int:
+        return self.__sum
+
+    @property
+    def min(self) -> int:
+        return self.__min
+
+    @property
+    def max(self) -> int:
+        return self.__max
+
+    @property
+    def mean(self) -> float:
+        return 0.0 if self.__count == 0 else self.__sum / self.__count
+
+    def percentile(self, q: float) -> int:
+        """
+        Returns the value below which a fraction `q` of the recorded values
+        fall, as the highest value of its bucket, 0 if nothing was recorded.
+        """
+        if self.__count == 0:
+            return 0
+        rank = max(int(q * self.__count + 0.5), 1)
+        seen = 0
+        for (index, count) in enumerate(self.__counts):
+            seen += count
+            if seen >= rank:
+                return min(self.bounds(index)[1], self.__max)
+        return self.__max
+
+    def buckets(self) -> list[tuple[int, int]]:
+        """
+        Returns the highest value and the count of every non-empty bucket.
+        """
+        return [(self.bounds(index)[1], count) for (index, count) in enumerate(self.__counts) if count > 0]
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "count": float(self.__count),
+            "sum": float(self.__sum),
+            "mean": self.mean,
+            "min": float(self.__min),
+            "p50": float(self.percentile(0.5)),
+            "p90": float(self.percentile(0.9)),
+            "p99": float(self.percentile(0.99)),
+            "max": float(self.__max),
+        }
+
+
+class Timer:
+    """
+    The `Timer` class times a block on the monotonic clock into `Metrics`,
+    e.g. `with metrics.timer("parse"): ...`.
+    """
+
+    __slots__ = ("__metrics", "__stage", "__provider", "__start")
+
+    def __init__(self, metrics: "Metrics", stage: str, provider: str) -> None:
+        self.__metrics: Metrics = metrics
+        self.__stage: str = stage
+        self.__provider: str = provider
+        self.__start: int = 0
+
+    def __enter__(self) -> "Timer":
+        self.__start = time.monotonic_ns()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.__metrics.observe(self.__stage, (time.monotonic_ns() - self.__start) // 1000, self.__provider)
+
+
+class Metrics:
+    """
+    The `Metrics` class gathers the latency histograms of the hot paths, by
+    stage and by provider, and plain counters. Recording a value costs a dict
+    lookup and a few integer operations, so it is always on unless `enabled`
+    is turned off. Stages are:
+
+    - `metadata_fetch`: reading the player state over D-Bus;
+    - `lookup`: a whole lookup, cache included, by the provider which answered;
+    - `interface`: one interface answering a lookup, by provider;
+    - `search`: one search of an interface, e.g. a page of results, by provider;
+    - `lyric_fetch`: an interface fetching the lyrics it chose, by provider;
+    - `parse`: parsing the LRC documents of a song;
+    - `align`: aligning its translations;
+    - `load`: loading them parsed from the disk cache instead;
+    - `signal_emit`: emitting the changes of an adaptor on the bus.
+    """
+
+    def __init__(self) -> None:
+        self.enabled: bool = True
+        self.__histograms: dict[tuple[str, str], Histogram] = {}
+        self.__counters: dict[tuple[str, str], int] = {}
+        self.__started: float = time.time()
+
+    @property
+    def histograms(self) -> dict[tuple[str, str], Histogram]:
+        """
+        Returns the histograms by stage and provider, the provider being "" for stages not specific to one
+        """
+        return self.__histograms
+
+    @property
+    def counters(self) -> dict[tuple[str, str], int]:
+        """
+        Returns the counters by name and provider, the provider being "" for counters not specific to one
+        """
+        return self.__counters
+
+    @property
+    def started(self) -> float:
+        """
+        Returns when the metrics were last reset, in seconds since the epoch
+        """
+        return self.__started
+
+    def observe(self, stage: str, value: int, provider: str = "") -> None:
+        """
+        Record one latency.
+
+        :param stage: str: The stage timed
+        :param value: int: The latency in microseconds
+        :param provider: str: The interface the latency belongs to, if any
+        """
+        if not self.enabled:
+            return
+        histogram = self.__histograms.get((stage, provider))
+        if histogram is None:
+            histogram = self.__histograms[(stage, provider)] = Histogram()
+        histogram.record(value)
+
+    def timer(self, stage: str, provider: str = "") -> Timer:
+        return Timer(self, stage, provider)
+
+    def increment(self, name: str, provider: str = "", value: int = 1) -> None:
+        if not self.enabled:
+            return
+        self.__counters[(name, provider)] = self.__counters.get((name, provider), 0) + value
+
+    def reset(self) -> None:
+        self.__histograms = {}
+        self.__counters = {}
+        self.__started = time.time()
+
+    @staticmethod
+    def __escape(value: str) -> str:
+        return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+    @staticmethod
+    def __metric_name(name: str) -> str:
+        return "".join(c if c.isalnum() else "_" for c in name)
+
+    def prometheus(self, counters: dict[tuple[str, str], int] | None = None) -> str:
+        """
+        Render the histograms as Prometheus summaries and the counters as
+        Prometheus counters, in the text exposition format.
+
+        :param counters: dict[tuple[str, str], int] | None: Counters kept elsewhere, by name and provider
+        :return: The text to expose
+        """
+        lines = [
+            "# HELP lyrik_stage_seconds Latency of the LyriK hot paths by stage and provider.",
+            "# TYPE lyrik_stage_seconds summary",
+        ]
+        for ((stage, provider), histogram) in sorted(self.__histograms.items()):
+            labels = f'stage="{self.__escape(stage)}",provider="{self.__escape(provider)}"'
+            for q in (0.5, 0.9, 0.99):
+                lines.append(f'lyrik_stage_seconds{{{labels},quantile="{q}"}} {histogram.percentile(q) / 1e6}')
+            lines.append(f"lyrik_stage_seconds_sum{{{labels}}} {histogram.sum / 1e6}")
+            lines.append(f"lyrik_stage_seconds_count{{{labels}}} {histogram.count}")
+        merged = dict(self.__counters)
+        if counters is not None:
+            merged.update(counters)
+        typed: set[str] = set()
+        for ((name, provider), value) in sorted(merged.items()):
+            metric = f"lyrik_{self.__metric_name(name)}_total"
+            if metric not in typed:
+                typed.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            if provider == "":
+                lines.append(f"{metric} {value}")
+            else:
+                lines.append(f'{metric}{{provider="{self.__escape(provider)}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+
+metrics: Metrics = Metrics()
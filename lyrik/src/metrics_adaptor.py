@@ -0,0 +1,112 @@
+import asyncio
+import os
+
+from dbus_next.service import ServiceInterface, dbus_property, PropertyAccess, method
+
+from metrics import Metrics, metrics
+from interface_manager import InterfaceManager
+from lyrics_timeline import ParsedLyricsCache, parsed_lyrics_cache
+
+from loguru import logger
+
+
+class MetricsAdaptor(ServiceInterface):
+    """
+    The `MetricsAdaptor` class exposes `Metrics` as `org.LyriK.Metrics`: the
+    latency histograms by stage and provider, the counters, and the same as
+    Prometheus text. Cache and coalescing counters are read from the
+    `InterfaceManager` and the parsed lyrics cache, and count since start.
+    With `dump`, the Prometheus text is also written to a file periodically,
+    e.g. for the node_exporter textfile collector.
+    """
+
+    def __init__(
+        self,
+        interface_manager: InterfaceManager | None = None,
+        registry: Metrics = metrics,
+        parsed_cache: ParsedLyricsCache = parsed_lyrics_cache,
+    ) -> None:
+        """
+        :param interface_manager: InterfaceManager | None: The manager whose cache and coalescing counters to include
+        :param registry: Metrics: The metrics to expose
+        :param parsed_cache: ParsedLyricsCache: The parsed lyrics cache whose counters to include
+        """
+        super().__init__("org.LyriK.Metrics")
+        self.__interface_manager: InterfaceManager | None = interface_manager
+        self.__metrics: Metrics = registry
+        self.__parsed_cache: ParsedLyricsCache = parsed_cache
+
+    def counters(self) -> dict[tuple[str, str], int]:
+        """
+        Returns every counter by name and provider, the kept ones and the read ones
+        """
+        counters = dict(self.__metrics.counters)
+        counters[("parsed_cache_hits", "")] = self.__parsed_cache.hits
+        counters[("parsed_cache_disk_hits", "")] = self.__parsed_cache.disk_hits
+        counters[("parsed_cache_misses", "")] = self.__parsed_cache.misses
+        if self.__interface_manager is not None:
+            counters[("coalesced", "")] = self.__interface_manager.coalesced
+            cache = self.__interface_manager.cache
+            if cache is not None:
+                counters[("cache_hits", "")] = cache.hits
+                counters[("cache_negative_hits", "")] = cache.negative_hits
+                counters[("cache_misses", "")] = cache.misses
+        return counters
+
+    def prometheus(self) -> str:
+        return self.__metrics.prometheus(self.counters())
+
+    async def dump(self, path: str, interval: float) -> None:
+        """
+        Write the Prometheus text to `path` every `interval` seconds, replacing the file atomically.
+        """
+        while True:
+            try:
+                with open(f"{path}.tmp", "w") as file:
+                    file.write(self.prometheus())
+                os.replace(f"{path}.tmp", path)
+            except OSError as exception:
+                logger.critical(f"Cannot write the metrics to {path}: {exception!r}")
+            await asyncio.sleep(interval)
+
+    @dbus_property(PropertyAccess.READWRITE)
+    def Enabled(self) -> "b":
+        return self.__metrics.enabled
+
+    @Enabled.setter
+    def Enabled(self, enabled: "b"):
+        self.__metrics.enabled = enabled
+
+    @dbus_property(PropertyAccess.READ)
+    def Since(self) -> "d":
+        return self.__metrics.started
+
+    @method()
+    def GetHistograms(self) -> "a(ssa{sd})":
+        """
+        Returns the summary of every histogram, in microseconds, as (stage, provider, summary).
+        """
+        return [
+            [stage, provider, histogram.summary()]
+            for ((stage, provider), histogram) in sorted(self.__metrics.histograms.items())
+        ]
+
+    @method()
+    def GetBuckets(self, stage: "s", provider: "s") -> "a(tt)":
+        """
+        Returns the non-empty buckets of one histogram as (highest value in microseconds, count).
+        """
+        histogram = self.__metrics.histograms.get((stage, provider))
+        return [] if histogram is None else [list(x) for x in histogram.buckets()]
+
+    @method()
+    def GetCounters(self) -> "a(sst)":
+        return [[name, provider, value] for ((name, provider), value) in sorted(self.counters().items())]
+
+    @method()
+    def GetPrometheus(self) -> "s":
+        return self.prometheus()
+
+    @method()
+    def Reset(self):
+        self.__metrics.reset()
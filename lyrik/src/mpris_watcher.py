@@ -1,18 +1,26 @@
 import asyncio
-
-import pylrc
-
-from pylrc.classes import Lyrics, LyricLine
+import time
+from contextlib import aclosing
+from array import array
 
 from dbus_next.aio import MessageBus, ProxyInterface
 from dbus_next.signature import Variant
 from dbus_next.errors import DBusError
 
-from typing import Callable
+from typing import Callable, TYPE_CHECKING
 
-from netwrok_interface import AbstractNetworkInterface, LyricsResponse
-from netease_music_interface import NeteaseMusicInterface
+from netwrok_interface import LyricsResponse
+from lyrics_timeline import LyricsTimeline, TimelineCursor, WordCursor, ParsedLyricsCache, parsed_lyrics_cache
 from interface_manager import InterfaceManager, NetworkError, AllNoFoundError
+from lyrics_cache import LyricsCache
+from track_prefetcher import TrackPrefetcher
+from track_metadata import read_track
+from metrics import metrics
+
+from loguru import logger
+
+if TYPE_CHECKING:
+    from trace_recorder import TraceRecorder
 
 class MprisWatcher:
     introspection: str = """
@@ -99,17 +107,56 @@ class MprisWatcher:
                 <arg type="x" />
             </signal>
         </interface>
+        <interface name="org.mpris.MediaPlayer2.TrackList">
+            <property name="Tracks" type="ao" access="read" />
+            <property name="CanEditTracks" type="b" access="read" />
+            <method name="GetTracksMetadata">
+                <arg direction="in" type="ao" />
+                <arg direction="out" type="aa{sv}" />
+            </method>
+            <method name="AddTrack">
+                <arg direction="in" type="s" />
+                <arg direction="in" type="o" />
+                <arg direction="in" type="b" />
+            </method>
+            <method name="RemoveTrack">
+                <arg direction="in" type="o" />
+            </method>
+            <method name="GoTo">
+                <arg direction="in" type="o" />
+            </method>
+            <signal name="TrackListReplaced">
+                <arg type="ao" />
+                <arg type="o" />
+            </signal>
+            <signal name="TrackAdded">
+                <arg type="a{sv}" />
+                <arg type="o" />
+            </signal>
+            <signal name="TrackRemoved">
+                <arg type="o" />
+            </signal>
+            <signal name="TrackMetadataChanged">
+                <arg type="o" />
+                <arg type="a{sv}" />
+            </signal>
+        </interface>
     </node>
         """
 
     @classmethod
-    def parse_lyrics(cls, lrc: str) -> list[dict[int:str]]:
-        lyrics: list[dict[int, str]] = []
-        for line in pylrc.parse(lrc):
-            lyrics.append({int(line.time * 1000000): line.text})
-        return lyrics
-
-    def __init__(self, bus: MessageBus, mpris_name: str) -> None:
+    def parse_lyrics(cls, lrc: str) -> LyricsTimeline:
+        return LyricsTimeline.parse(lrc)
+
+    def __init__(
+        self,
+        bus: MessageBus,
+        mpris_name: str,
+        config: dict[str] | None = None,
+        interface_manager: InterfaceManager | None = None,
+        recorder: "TraceRecorder | None" = None,
+        parsed_cache: ParsedLyricsCache | None = None,
+    ) -> None:
         """
         The __init__ function is called when the class is instantiated.
         It sets up the initial state of the object, and does any other
@@ -117,7 +164,10 @@ class MprisWatcher:
 
         :param self: Refer to the current object
         :param mpris_name: str: Identify the player that is currently playing
-        :param bus_interface: ProxyInterface: Create a interface object
+        :param config: dict[str]: The `General` section of the configuration, intervals are in milliseconds
+        :param interface_manager: InterfaceManager | None: The manager shared with other watchers, a private one is created if None
+        :param recorder: TraceRecorder | None: Where to record what the player sends, for replaying it later
+        :param parsed_cache: ParsedLyricsCache | None: The cache of parsed lyrics, the shared one if None
         :return: None
         :doc-author: Trelent
         """
@@ -126,18 +176,45 @@ class MprisWatcher:
         self.__album: str = ""
         self.__artist: list = []
         self.__playback: str = ""
+        self.__rate: float = 1.0
 
         self.__mpris_name: str = mpris_name
 
-        self.__network_interface: InterfaceManager = InterfaceManager(None, {"Disabled": [], "Priority": ["NeteaseMusicInterface"]})
+        if config is None:
+            config = {}
+        self.__interval: float = config.get("Interval", 50) / 1000
+        self.__sync_interval: float = config.get("SyncInterval", 5000) / 1000
+        self.__align_tolerance: int = config.get("AlignTolerance", 250) * 1000
+        self.__debounce: float = config.get("Debounce", 150) / 1000
+
+        if interface_manager is None:
+            interface_manager = InterfaceManager(
+                None, {"Disabled": [], "Priority": ["LocalLibraryInterface", "NeteaseMusicInterface"]}, LyricsCache()
+            )
+        self.__network_interface: InterfaceManager = interface_manager
+        self.__recorder: TraceRecorder | None = recorder
+        self.__parsed_cache: ParsedLyricsCache = parsed_lyrics_cache if parsed_cache is None else parsed_cache
 
         self.__position = 0
+        self.__position_timestamp: float = time.monotonic()
+        self.__last_sync: float = 0.0
+
+        self.__wakeup: asyncio.Event = asyncio.Event()
+
+        self.__generation: int = 0
+        self.__lookup_task: asyncio.Task | None = None
+        self.__lyrics_changed: bool = False
+        self.__playback_changed: bool = False
 
         self.__index: int = -1
+        self.__word_index: int = -1
         self.__translations_indexes: dict[str:int] = {}
 
-        self.__original_lyrics: list[dict[int:str]] = []
-        self.__translations: dict[str, list[dict[int:str]]] = {}
+        self.__original_lyrics: LyricsTimeline = LyricsTimeline()
+        self.__translations: dict[str, LyricsTimeline] = {}
+        self.__cursor: TimelineCursor = self.__original_lyrics.cursor()
+        self.__word_cursor: WordCursor = self.__original_lyrics.word_cursor()
+        self.__alignments: dict[str, array] = {}
 
         self.__callback: list[Callable] = []
 
@@ -149,13 +226,28 @@ class MprisWatcher:
         self.__interface: ProxyInterface = self.__proxy.get_interface(
             "org.mpris.MediaPlayer2.Player"
         )
+        self.__properties: ProxyInterface = self.__proxy.get_interface(
+            "org.freedesktop.DBus.Properties"
+        )
         self.position_changed: asyncio.Event = asyncio.Event()
         self.song_changed: asyncio.Event = asyncio.Event()
 
+        self.__prefetcher: TrackPrefetcher | None = None
+        if config.get("Prefetch", 0) > 0:
+            self.__prefetcher = TrackPrefetcher(
+                self.__proxy,
+                self.__network_interface,
+                config["Prefetch"],
+                config.get("PrefetchConcurrency", 1),
+                config.get("PrefetchLead", 10000) / 1000,
+                self.__align_tolerance,
+                self.__parsed_cache,
+            )
+
     def add_callable(self, func: Callable) -> None:
         """
         This function is used to add callable functions to the class.
-        They will be called when the index or lyrics is changed.
+        They will be called when the index, the lyrics or the playback status is changed.
 
         :param func: Callable: The function to call
         :return: None
@@ -164,28 +256,64 @@ class MprisWatcher:
 
         self.__callback.append(func)
 
-    def __update_lyrics(self, reponse: LyricsResponse) -> None:
-        self.__original_lyrics = self.parse_lyrics(reponse.lyrics)
-        self.__original_lyrics.sort(key=lambda x: list(x.items())[0][0])
-        if reponse.translation is not None:
-            translation: dict[str : list[dict[int:str]]] = {}
-            for pair in reponse.translation.items():
-                translation[pair[0]] = self.parse_lyrics(pair[1])
-            self.__translations = translation
-        else:
+    def __update_lyrics(self, reponse: LyricsResponse | None) -> None:
+        if reponse is None:
+            self.__original_lyrics = LyricsTimeline()
             self.__translations = {}
+            self.__alignments = {}
+        else:
+            parsed = self.__parsed_cache.load(reponse.lyrics, reponse.translation, self.__align_tolerance)
+            self.__original_lyrics = parsed.original
+            self.__translations = parsed.translations
+            self.__alignments = parsed.alignments
+        self.__cursor = self.__original_lyrics.cursor()
+        self.__word_cursor = self.__original_lyrics.word_cursor()
+        self.__index = -1
+        self.__word_index = -1
+        self.__translations_indexes = {}
+        self.__lyrics_changed = True
+
+    def __update_index(self) -> bool:
+        """
+        Advance `index`, `word_index` and `translations_indexes` to the current position.
 
-    def __update_index(self) -> None:
-        for i in range(len(self.__original_lyrics)):
-            if list(self.__original_lyrics[i].keys())[0] > self.__position:
-                self.__index = i - 1
-                break
-        for item in self.__translations.items():
-            for i in range(len(self.__original_lyrics)):
-                if list(item[1][i].keys())[0] > self.__position:
-                    self.__translations_indexes[item[0]] = i - 1
-                    break
+        :return: Whether any of the indexes moved
+        """
+        position = self.position
+        index = self.__cursor.advance(position)
+        word_index = self.__word_cursor.advance(index, position)
+        if index == self.__index and len(self.__translations_indexes) == len(self.__alignments):
+            if word_index == self.__word_index:
+                return False
+            self.__word_index = word_index
+            return True
+        self.__index = index
+        self.__word_index = word_index
+        self.__translations_indexes = {
+            language: -1 if index < 0 else alignment[index] for language, alignment in self.__alignments.items()
+        }
+        return True
+
+    def __next_boundary(self) -> float | None:
+        """
+        Compute how long to sleep until the next lyric line or word starts,
+        taking `Rate` and `PlaybackStatus` into account.
 
+        :return: The delay in seconds, or None if no line boundary is ahead
+        """
+        if self.__playback != "Playing" or self.__rate <= 0:
+            return None
+        boundary = self.__cursor.next_timestamp
+        word_boundary = self.__word_cursor.next_timestamp
+        if word_boundary is not None and (boundary is None or word_boundary < boundary):
+            boundary = word_boundary
+        if boundary is None:
+            return None
+        return max(boundary - self.position, 0) / self.__rate / 1000000
+
+    def __notify(self) -> None:
+        for func in self.__callback:
+            func()
 
     @property
     def title(self) -> str:
@@ -198,6 +326,31 @@ class MprisWatcher:
         """
         return self.__title
 
+    @property
+    def interface_manager(self) -> InterfaceManager:
+        return self.__network_interface
+
+    @property
+    def mpris_name(self) -> str:
+        return self.__mpris_name
+
+    @property
+    def playback(self) -> str:
+        """
+        The `PlaybackStatus` of the player: "Playing", "Paused" or "Stopped".
+        """
+        return self.__playback
+
+    @property
+    def generation(self) -> int:
+        """
+        The generation function returns a number which grows by one on every song change.
+
+        :param self: Refer to the current instance of the class
+        :return: The song generation
+        """
+        return self.__generation
+
     @property
     def index(self) -> int:
         """
@@ -209,6 +362,28 @@ class MprisWatcher:
         """
         return self.__index
 
+    @property
+    def word_index(self) -> int:
+        """
+        The index of the current word within the current line, -1 before its first word or without word timing.
+        """
+        return self.__word_index
+
+    @property
+    def position(self) -> int:
+        """
+        The position function returns the playback position in microseconds.
+        It is extrapolated from the last position reported by the player,
+        the playback rate and a monotonic clock, so reading it costs no D-Bus call.
+
+        :param self: Refer to the current instance of the class
+        :return: The estimated position in microseconds
+        """
+        if self.__playback != "Playing":
+            return self.__position
+        elapsed = time.monotonic() - self.__position_timestamp
+        return self.__position + int(elapsed * self.__rate * 1000000)
+
     @property
     def translations_indexes(self) -> dict[str:int]:
         return self.__translations_indexes
@@ -222,8 +397,23 @@ class MprisWatcher:
         :return: The original lyrics of the song
         :doc-author: Trelent
         """
+        return self.__original_lyrics.to_list()
+
+    @property
+    def timeline(self) -> LyricsTimeline:
         return self.__original_lyrics
 
+    @property
+    def translation_timelines(self) -> dict[str, LyricsTimeline]:
+        return self.__translations
+
+    @property
+    def alignments(self) -> dict[str, array]:
+        """
+        The index of the translation line aligned to every original line, or -1, by language.
+        """
+        return self.__alignments
+
     @property
     def translations(self) -> dict[str, list]:
         """
@@ -235,46 +425,229 @@ class MprisWatcher:
         :return: A dictionary of the form {'language': ['translation', 'translation']}
         :doc-author: Trelent
         """
-        return self.__translations
+        return {language: timeline.to_list() for language, timeline in self.__translations.items()}
+
+    def __set_position(self, position: int) -> None:
+        self.__position = position
+        self.__position_timestamp = time.monotonic()
+
+    def __on_metadata(self, metadata: dict[str:Variant]) -> bool:
+        """
+        Switch songs if `metadata` is a new one. Metadata which cannot be read
+        is logged and ignored, so that one bad record does not end `watch`.
+
+        :return: Whether the song changed
+        """
+        try:
+            if not self.__is_new_song(metadata):
+                return False
+            self.__change_song(metadata)
+        except Exception as exception:
+            logger.critical(f"Cannot read the metadata of {self.__mpris_name}: {exception!r}")
+            return False
+        return True
+
+    def __change_song(self, metadata: dict[str:Variant]) -> None:
+        """
+        Switch to a new song: drop the old lyrics right away and start a
+        lookup for the new ones, cancelling the lookup of the previous song.
+        """
+        self.__generation += 1
+        (self.__title, self.__album, self.__artist) = read_track(metadata)
+        if self.__lookup_task is not None:
+            self.__lookup_task.cancel()
+            self.__lookup_task = None
+        if self.__title == "":
+            # Nothing to look up, e.g. the player stopped and cleared its metadata.
+            self.__update_lyrics(None)
+            self.song_changed.set()
+            self.__wakeup.set()
+            return
+        track_id = metadata.get("xesam:url") or metadata.get("mpris:trackid")
+        # A cached (e.g. prefetched) song takes effect at once, without the debounce window.
+        response = self.__network_interface.peek(
+            self.__title, self.__album, self.__artist, None if track_id is None else track_id.value
+        )
+        self.__update_lyrics(response)
+        if response is None:
+            # Prefetches wait for this lookup from now on, not only once the debounce window is over.
+            self.__network_interface.enter_foreground()
+            self.__lookup_task = asyncio.ensure_future(self.__lookup(metadata, self.__generation))
+            self.__lookup_task.add_done_callback(lambda _: self.__network_interface.exit_foreground())
+        else:
+            self.song_changed.set()
+        if self.__prefetcher is not None:
+            self.__prefetcher.track_changed(metadata)
+        self.__wakeup.set()
+
+    async def __lookup(self, metadata: dict[str:Variant], generation: int) -> None:
+        # Bursts of track changes only get past the debounce window for the last track.
+        await asyncio.sleep(self.__debounce)
+        track_id = metadata.get("xesam:url") or metadata.get("mpris:trackid")
+        try:
+            # Show the first hazy match at once and upgrade it as better matches land.
+            async with aclosing(
+                self.__network_interface.stream_lyrics(
+                    *read_track(metadata),
+                    True,
+                    None if track_id is None else track_id.value,
+                    metadata["mpris:length"].value if "mpris:length" in metadata else None,
+                )
+            ) as responses:
+                async for response in responses:
+                    if generation != self.__generation:
+                        return
+                    self.__update_lyrics(response)
+                    self.song_changed.set()
+                    self.__wakeup.set()
+        except (AllNoFoundError, NetworkError):
+            pass
+
+    def __is_new_song(self, metadata: dict[str:Variant]) -> bool:
+        (title, _, artist) = read_track(metadata)
+        return title != self.__title or artist != self.__artist
+
+    async def __sync(self) -> None:
+        """
+        Re-read the player state in a single `GetAll` round trip and
+        re-anchor the extrapolated position on it.
+        """
+        with metrics.timer("metadata_fetch"):
+            properties: dict[str:Variant] = await self.__properties.call_get_all(
+                "org.mpris.MediaPlayer2.Player"
+            )
+        self.__last_sync = time.monotonic()
+        if self.__recorder is not None:
+            self.__recorder.sync(self.__mpris_name, properties)
+        if "PlaybackStatus" in properties:
+            self.__set_playback(properties["PlaybackStatus"].value)
+        if "Rate" in properties:
+            self.__rate = properties["Rate"].value
+        if "Position" in properties:
+            self.__set_position(properties["Position"].value)
+        if "Metadata" in properties:
+            self.__on_metadata(properties["Metadata"].value)
+
+    def __on_properties_changed(
+        self, interface_name: str, changed_properties: dict[str:Variant], invalidated_properties: list[str]
+    ) -> None:
+        if interface_name != "org.mpris.MediaPlayer2.Player":
+            return
+        if self.__recorder is not None:
+            self.__recorder.properties_changed(self.__mpris_name, changed_properties, invalidated_properties)
+        # Anchor the extrapolation before the rate or the playback status changes under it.
+        self.__set_position(self.position)
+        if "Rate" in changed_properties:
+            self.__rate = changed_properties["Rate"].value
+        if "PlaybackStatus" in changed_properties:
+            self.__set_playback(changed_properties["PlaybackStatus"].value)
+            # Players do not emit `Seeked` when they stop or restart a track.
+            self.__last_sync = 0.0
+        if "Position" in changed_properties:
+            self.__set_position(changed_properties["Position"].value)
+        if "Metadata" in changed_properties and self.__on_metadata(changed_properties["Metadata"].value):
+            self.__last_sync = 0.0
+        self.__wakeup.set()
+
+    def __set_playback(self, playback: str) -> None:
+        if playback != self.__playback:
+            self.__playback = playback
+            self.__playback_changed = True
+
+    def __on_seeked(self, position: int) -> None:
+        if self.__recorder is not None:
+            self.__recorder.seeked(self.__mpris_name, position)
+        self.__set_position(position)
+        self.__wakeup.set()
+
+    async def watch(self) -> None:
+        """
+        The watch function follows the player through its `PropertiesChanged`
+        and `Seeked` signals instead of polling it.
+        Between signals the position is extrapolated locally, and it is only
+        re-synced from the player every `SyncInterval` milliseconds.
+        While playing, it sleeps exactly until the next lyric line boundary,
+        then advances the indexes and fires the registered callables.
+
+        :param self: Refer to the current instance of the class
+        :return: None
+        """
+        self.__properties.on_properties_changed(self.__on_properties_changed)
+        self.__interface.on_seeked(self.__on_seeked)
+        try:
+            await self.__sync()
+            while True:
+                lyrics_changed, self.__lyrics_changed = self.__lyrics_changed, False
+                playback_changed, self.__playback_changed = self.__playback_changed, False
+                if self.__update_index() or lyrics_changed:
+                    self.position_changed.set()
+                    self.__notify()
+                elif playback_changed:
+                    self.__notify()
+                if self.__prefetcher is not None:
+                    self.__prefetcher.tick(self.position)
+
+                timeout = self.__sync_interval - (time.monotonic() - self.__last_sync)
+                boundary = self.__next_boundary()
+                if boundary is not None:
+                    timeout = min(timeout, boundary)
+                try:
+                    await asyncio.wait_for(self.__wakeup.wait(), max(timeout, 0))
+                except asyncio.TimeoutError:
+                    pass
+                self.__wakeup.clear()
+
+                if time.monotonic() - self.__last_sync >= self.__sync_interval:
+                    await self.__sync()
+        except DBusError as e:
+            print(f"Error: {e}")
+        finally:
+            if self.__lookup_task is not None:
+                self.__lookup_task.cancel()
+            if self.__prefetcher is not None:
+                self.__prefetcher.cancel()
+            self.__properties.off_properties_changed(self.__on_properties_changed)
+            self.__interface.off_seeked(self.__on_seeked)
 
     async def polling(self):
         try:
             while True:
-                metadata: dict[str:Variant] = await self.__interface.get_metadata()
-                position: int = await self.__interface.get_position()
-                playback: str = await self.__interface.get_playback_status()
-                self.__playback = playback
-
-                if (
-                    metadata["xesam:title"].value != self.__title
-                    or metadata["xesam:artist"].value != self.__artist
-                ):
-                    self.__title = metadata["xesam:title"].value
-                    self.__album = metadata["xesam:album"].value
-                    self.__artist = metadata["xesam:artist"].value
-                    response: LyricsResponse = await self.__network_interface.get_lyrics(
-                        self.__title, self.__album, self.__artist, True
+                with metrics.timer("metadata_fetch"):
+                    metadata: dict[str:Variant] = await self.__interface.get_metadata()
+                    position: int = await self.__interface.get_position()
+                    playback: str = await self.__interface.get_playback_status()
+                if self.__recorder is not None:
+                    self.__recorder.sync(
+                        self.__mpris_name,
+                        {
+                            "Metadata": Variant("a{sv}", metadata),
+                            "Position": Variant("x", position),
+                            "PlaybackStatus": Variant("s", playback),
+                        },
                     )
-                    if response is None:
-                        self.__index = -1
-                        self.__original_lyrics = []
-                        self.__translations = {}
-                    else:
-                        self.__update_lyrics(response)
+                self.__set_playback(playback)
 
-                    self.song_changed.set()
+                self.__on_metadata(metadata)
 
-                if position != self.__position:
-                    self.__position = position
-                    self.__update_index()
+                lyrics_changed, self.__lyrics_changed = self.__lyrics_changed, False
+                playback_changed, self.__playback_changed = self.__playback_changed, False
+                if position != self.__position or lyrics_changed:
+                    self.__set_position(position)
+                    if self.__update_index() or lyrics_changed:
+                        self.__notify()
+                        playback_changed = False
                     self.position_changed.set()
+                if playback_changed:
+                    self.__notify()
+
+                await asyncio.sleep(self.__interval)
         except DBusError as e:
             print(f"Error: {e}")
 
 async def main():
     bus = await MessageBus().connect()
     a = MprisWatcher(bus, "yesplaymusic")
-    await a.polling()
+    await a.watch()
 
 
 if __name__ == "__main__":
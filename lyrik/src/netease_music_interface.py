@@ -7,78 +7,160 @@ from netwrok_interface import (
     InternetError,
 )
 
-from pycloudmusic import Music163Api
+from pycloudmusic import MUSIC_HEADERS
 
 from pycloudmusic.error import Music163BadCode, CannotConnectApi, Music163BadData
 
+from transport import AbstractTransport, HttpTransport, TransportError
+
+from candidate_ranking import Candidate, CandidateRanker, RankedCandidate, MINIMUM_CONFIDENCE
+from metrics import metrics
+
 from typing import Generator, Tuple, Dict, Any
 
 import asyncio
+import time
 
 
 class NeteaseMusicInterface(AbstractNetworkInterface):
-    def __init__(self) -> None:
-        self.__api = Music163Api()
+    def __init__(
+        self,
+        transport: AbstractTransport | None = None,
+        config: dict[str] | None = None,
+        max_pages: int = 10,
+        concurrency: int = 4,
+    ) -> None:
+        """
+        :param transport: AbstractTransport | None: The shared transport, a private one is created if None
+        :param config: dict[str] | None: The `NeteaseMusicInterface` section of the configuration
+        :param max_pages: int: The maximum number of search result pages to look through
+        :param concurrency: int: The maximum number of search result pages fetched at once
+        """
+        super().__init__(transport, config)
+        self.__transport: AbstractTransport = HttpTransport() if transport is None else transport
+        self.__max_pages: int = self.config.get("MaxPages", max_pages)
+        self.__concurrency: int = self.config.get("Concurrency", concurrency)
+        self.__threshold: float = self.config.get("MinConfidence", MINIMUM_CONFIDENCE)
 
     @classmethod
     def name(cls) -> str:
         return "NeteaseMusicInterface"
 
-    async def get_lyrics(
-        self, title: str, album: str, artist: str, hazy_search=True
-    ) -> LyricsResponse:
-        result: tuple[
-            int, Generator[Music, None, None]
-        ] = await self.__api.search_music(
-            "{0} {1} {2}".format(title, album, " ".join(artist)), 0
-        )
-        (count, generator) = result
-        music_list: list[tuple[int, Music]] = []
-        for page in range(count // 30 if count % 30 == 0 else count // 30 + 1):
-            try:
-                result: tuple[
-                    int, Generator[Music, None, None]
-                ] = await self.__api.search_music(
-                    "{0} {1} {2}".format(title, album, " ".join(artist)), page
+    async def warm_up(self) -> None:
+        await self.__transport.warm_up("https://music.163.com/")
+
+    @classmethod
+    def __scan(
+        cls,
+        ranker: CandidateRanker,
+        generator: Generator[Music, None, None],
+        threshold: float,
+        ranked: list[RankedCandidate] | None,
+    ) -> Music | None:
+        """
+        Rank one page of search results, collecting the hazy candidates into `ranked`.
+
+        :return: The exact match on the page, if any
+        """
+        page = ranker.rank(
+            (
+                Candidate(
+                    music.name[0],
+                    music.album_data["name"],
+                    [a["name"] for a in music.artist],
+                    music.duration_ms * 1000,
+                    music,
                 )
-                for music in generator:
-                    if not music.name[0] == title:
-                        continue
-                    if music.album_data["name"] == album and set(
-                        a["name"] for a in music.artist
-                    ) == set(artist):
-                        lyrics = await music.lyric()
-                        return LyricsResponse(
-                            False,
-                            lyrics["lrc"]["lyric"],
-                            None
-                            if lyrics["tlyric"]["lyric"] == ""
-                            else {"zh_CN": lyrics["tlyric"]["lyric"]},
-                            self.name()
-                        )
-                    elif hazy_search:
-                        weight = 0
-                        if music.album_data["name"] == album:
-                            weight += 1
-                        if set(a["name"] for a in music.artist) == set(artist):
-                            weight += 1
-                        music_list.append((weight, music))
-            except KeyError as exception:
-                raise NoFoundError(self, title, artist, album) from exception
-            except (Music163BadData, Music163BadCode, CannotConnectApi) as exception:
-                raise InternetError(self) from exception
-        if len(music_list) == 0:
-            raise NoFoundError(self, title, artist, album)
-        lyrics = await max(music_list, key=lambda x: x[0])[1].lyric()
+                for music in generator
+            ),
+            threshold,
+        )
+        if len(page) > 0 and page[0].exact:
+            return page[0].candidate.item
+        if ranked is not None:
+            ranked.extend(page)
+        return None
+
+    async def __post(self, path: str, data: dict[str, Any]) -> dict[str, Any]:
+        result = await self.__transport.post(f"https://music.163.com{path}", data, MUSIC_HEADERS)
+        if result.get("code") != 200:
+            raise Music163BadCode(result)
+        return result
+
+    async def __search(self, keyword: str, page: int) -> tuple[int, Generator[Music, None, None]]:
+        start = time.monotonic_ns()
+        data = await self.__post(
+            "/api/cloudsearch/pc",
+            {"s": keyword, "type": 1, "limit": 30, "offset": 30 * page, "total": True},
+        )
+        metrics.observe("search", (time.monotonic_ns() - start) // 1000, self.name())
+        return data["result"]["songCount"], (Music(music_data) for music_data in data["result"]["songs"])
+
+    async def __response(self, music: Music, hazy: bool) -> LyricsResponse:
+        start = time.monotonic_ns()
+        lyrics = await self.__post("/api/song/lyric", {"id": music.id, "lv": -1, "kv": -1, "tv": -1, "yv": -1})
+        metrics.observe("lyric_fetch", (time.monotonic_ns() - start) // 1000, self.name())
+        # `yrc` has word timing, the plain `lrc` only line timing.
+        yrc = lyrics.get("yrc", {}).get("lyric", "")
         return LyricsResponse(
-            True,
-            lyrics["lrc"]["lyric"],
+            hazy,
+            lyrics["lrc"]["lyric"] if yrc == "" else yrc,
             None
             if lyrics["tlyric"]["lyric"] == ""
             else {"zh_CN": lyrics["tlyric"]["lyric"]},
             self.name()
         )
 
+    async def get_lyrics(
+        self, title: str, album: str, artist: str, hazy_search=True, length: int | None = None
+    ) -> LyricsResponse:
+        """
+        Search for the song and rank the first result page. Without an exact
+        match there, walk the other pages, fetching up to `concurrency` of
+        them at once. Every page is ranked as soon as it arrives, and the
+        remaining fetches are cancelled on an exact match.
+        Otherwise the most confident candidate is the hazy match.
+        """
+        keyword = "{0} {1} {2}".format(title, album, " ".join(artist))
+        semaphore = asyncio.Semaphore(self.__concurrency)
+
+        async def fetch(page: int) -> Generator[Music, None, None]:
+            async with semaphore:
+                result: tuple[
+                    int, Generator[Music, None, None]
+                ] = await self.__search(keyword, page)
+                return result[1]
+
+        tasks: list[asyncio.Task] = []
+        ranker = CandidateRanker(title, album, artist, length)
+        ranked: list[RankedCandidate] = []
+        try:
+            (count, generator) = await self.__search(keyword, 0)
+            # The first page usually holds the exact match, the others are only fetched without it.
+            exact = self.__scan(ranker, generator, self.__threshold, ranked if hazy_search else None)
+            if exact is None:
+                pages = min(count // 30 if count % 30 == 0 else count // 30 + 1, self.__max_pages)
+                tasks = [asyncio.ensure_future(fetch(page)) for page in range(1, pages)]
+                for page in asyncio.as_completed(tasks):
+                    exact = self.__scan(ranker, await page, self.__threshold, ranked if hazy_search else None)
+                    if exact is not None:
+                        break
+            # No page is fetched any more while the lyrics are.
+            for task in tasks:
+                task.cancel()
+            if exact is not None:
+                return await self.__response(exact, False)
+            if len(ranked) == 0:
+                raise NoFoundError(self, title, artist, album)
+            return await self.__response(max(ranked, key=lambda x: x.confidence).candidate.item, True)
+        except KeyError as exception:
+            raise NoFoundError(self, title, artist, album) from exception
+        except (Music163BadData, Music163BadCode, CannotConnectApi, TransportError) as exception:
+            raise InternetError(self) from exception
+        finally:
+            for task in tasks:
+                task.cancel()
+
 
 async def main():
     api = NeteaseMusicInterface()
@@ -1,5 +1,6 @@
 import abc
-from loguru import logger
+
+from transport import AbstractTransport
 
 
 class LyricsResponse:
@@ -16,6 +17,20 @@ class LyricsResponse:
 
 
 class AbstractNetworkInterface(abc.ABC):
+    """
+    The `AbstractNetworkInterface` class is the base of every lyrics interface.
+    `InterfaceManager` constructs interfaces as `interface_class(transport=transport, config=config)`,
+    handing them the shared `AbstractTransport` to make their requests with and
+    the section of the configuration named after the interface.
+    """
+
+    # Local interfaces make no requests and are not rate limited.
+    remote: bool = True
+
+    def __init__(self, transport: AbstractTransport | None = None, config: dict[str] | None = None) -> None:
+        self.transport: AbstractTransport | None = transport
+        self.config: dict[str] = {} if config is None else config
+
     @classmethod
     @abc.abstractmethod
     def name(cls) -> str:
@@ -23,8 +38,17 @@ class AbstractNetworkInterface(abc.ABC):
 
     @abc.abstractmethod
     async def get_lyrics(
-            self, title: str, album: str, artist: list, hazy_search=True
+            self, title: str, album: str, artist: list, hazy_search=True, length: int | None = None
     ) -> LyricsResponse:
+        """
+        :param length: int | None: The `mpris:length` of the song in microseconds, if the player reports it
+        """
+        pass
+
+    async def warm_up(self) -> None:
+        """
+        Prepare for a lookup which is likely to come soon, e.g. by opening connections.
+        """
         pass
 
 
@@ -0,0 +1,276 @@
+import asyncio
+import re
+from array import array
+from typing import Callable
+
+from dbus_next.aio import MessageBus, ProxyInterface
+
+from mpris_watcher import MprisWatcher
+from dbus_adaptor import DBusAdaptor
+from interface_manager import InterfaceManager
+from lyrics_cache import LyricsCache
+from transport import HttpTransport
+from lyrics_timeline import LyricsTimeline, ParsedLyricsCache, parsed_lyrics_cache
+from metrics import metrics
+from metrics_adaptor import MetricsAdaptor
+from trace_recorder import TraceRecorder
+
+
+class ActivePlayer:
+    """
+    The `ActivePlayer` class is a view of whichever watched player is playing,
+    with the same properties as `MprisWatcher` so that a `DBusAdaptor` can
+    adapt it. The player which started playing last wins; when the active
+    player goes away, the view falls back to another one.
+    """
+
+    def __init__(self) -> None:
+        self.__watchers: list[MprisWatcher] = []
+        self.__playback: dict[MprisWatcher, str] = {}
+        self.__active: MprisWatcher | None = None
+        self.__callback: list[Callable] = []
+        self.__empty: LyricsTimeline = LyricsTimeline()
+        self.__no_translations: dict[str, LyricsTimeline] = {}
+
+    def add_callable(self, func: Callable) -> None:
+        """
+        Add a callable called when the active player or its index or lyrics change.
+        """
+        self.__callback.append(func)
+
+    def __notify(self) -> None:
+        for func in self.__callback:
+            func()
+
+    def __switch(self, watcher: MprisWatcher | None) -> None:
+        if watcher is not self.__active:
+            self.__active = watcher
+            self.__notify()
+
+    def add(self, watcher: MprisWatcher) -> None:
+        self.__watchers.append(watcher)
+        self.__playback[watcher] = watcher.playback
+        watcher.add_callable(lambda: self.__on_updated(watcher))
+        if self.__active is None:
+            self.__switch(watcher)
+
+    def remove(self, watcher: MprisWatcher) -> None:
+        self.__watchers.remove(watcher)
+        del self.__playback[watcher]
+        if watcher is self.__active:
+            playing = [x for x in self.__watchers if x.playback == "Playing"]
+            candidates = playing if len(playing) > 0 else self.__watchers
+            self.__switch(candidates[-1] if len(candidates) > 0 else None)
+
+    def __on_updated(self, watcher: MprisWatcher) -> None:
+        if watcher not in self.__playback:
+            return
+        started = watcher.playback == "Playing" and self.__playback[watcher] != "Playing"
+        self.__playback[watcher] = watcher.playback
+        if started or (self.__active is not None and self.__active.playback != "Playing" and watcher.playback == "Playing"):
+            self.__switch(watcher)
+        elif watcher is self.__active:
+            self.__notify()
+
+    @property
+    def active(self) -> MprisWatcher | None:
+        return self.__active
+
+    @property
+    def mpris_name(self) -> str:
+        return "" if self.__active is None else self.__active.mpris_name
+
+    @property
+    def playback(self) -> str:
+        return "Stopped" if self.__active is None else self.__active.playback
+
+    @property
+    def title(self) -> str:
+        return "" if self.__active is None else self.__active.title
+
+    @property
+    def generation(self) -> int:
+        return 0 if self.__active is None else self.__active.generation
+
+    @property
+    def index(self) -> int:
+        return -1 if self.__active is None else self.__active.index
+
+    @property
+    def word_index(self) -> int:
+        return -1 if self.__active is None else self.__active.word_index
+
+    @property
+    def translations_indexes(self) -> dict[str, int]:
+        return {} if self.__active is None else self.__active.translations_indexes
+
+    @property
+    def timeline(self) -> LyricsTimeline:
+        return self.__empty if self.__active is None else self.__active.timeline
+
+    @property
+    def translation_timelines(self) -> dict[str, LyricsTimeline]:
+        return self.__no_translations if self.__active is None else self.__active.translation_timelines
+
+    @property
+    def alignments(self) -> dict[str, array]:
+        return {} if self.__active is None else self.__active.alignments
+
+    @property
+    def original_lyrics(self) -> list[dict[int, str]]:
+        return [] if self.__active is None else self.__active.original_lyrics
+
+    @property
+    def translations(self) -> dict[str, list[dict[int, str]]]:
+        return {} if self.__active is None else self.__active.translations
+
+    @property
+    def interface_manager(self) -> InterfaceManager | None:
+        return None if self.__active is None else self.__active.interface_manager
+
+
+class PlayerSupervisor:
+    """
+    The `PlayerSupervisor` class watches every MPRIS player on one bus
+    connection. It follows `NameOwnerChanged` for `org.mpris.MediaPlayer2.*`,
+    creating a `MprisWatcher` when a player appears and tearing it down when
+    it goes away. All watchers share one `InterfaceManager`, and with it one
+    cache, one transport and one lookup scheduler. Every player is exported
+    as its own `DBusAdaptor` at `/org/LyriK/Player/<name>`, and the one
+    playing at `/org/LyriK/Player/Active`. Its metrics are exported at
+    `/org/LyriK/Metrics`. With `[Trace] Path`, the session is recorded
+    there for `trace_replay`.
+    """
+
+    PREFIX = "org.mpris.MediaPlayer2."
+    ROOT = "/org/LyriK/Player"
+
+    def __init__(
+        self,
+        bus: MessageBus,
+        config: dict[str] | None = None,
+        interface_manager: InterfaceManager | None = None,
+        parsed_cache: ParsedLyricsCache = parsed_lyrics_cache,
+    ) -> None:
+        """
+        :param bus: MessageBus: The bus connection shared by every watcher
+        :param config: dict[str] | None: The whole configuration, by section
+        :param interface_manager: InterfaceManager | None: The shared manager, built from `config` if None
+        :param parsed_cache: ParsedLyricsCache: The cache of parsed lyrics shared by every watcher
+        """
+        if config is None:
+            config = {}
+        self.__bus: MessageBus = bus
+        self.__config: dict[str] = config.get("General", {})
+        trace_path: str = config.get("Trace", {}).get("Path", "")
+        self.__recorder: TraceRecorder | None = None if trace_path == "" else TraceRecorder(trace_path, config)
+        if interface_manager is None:
+            interface_manager = InterfaceManager(
+                None,
+                config.get("Interface", {"Disabled": [], "Priority": ["LocalLibraryInterface", "NeteaseMusicInterface"]}),
+                LyricsCache.from_config(config.get("Cache", {})),
+                HttpTransport.from_config(config.get("Transport", {})),
+                recorder=self.__recorder,
+            )
+        self.__interface_manager: InterfaceManager = interface_manager
+        self.__parsed_cache: ParsedLyricsCache = parsed_cache
+
+        metrics_config: dict[str] = config.get("Metrics", {})
+        metrics.enabled = metrics_config.get("Enabled", True)
+        self.__metrics_adaptor: MetricsAdaptor = MetricsAdaptor(interface_manager, parsed_cache=parsed_cache)
+        self.__prometheus_path: str = metrics_config.get("PrometheusPath", "")
+        self.__dump_interval: float = metrics_config.get("DumpInterval", 15000) / 1000
+
+        self.__watchers: dict[str, tuple[MprisWatcher, DBusAdaptor, asyncio.Task]] = {}
+        self.__active: ActivePlayer = ActivePlayer()
+        self.__active_adaptor: DBusAdaptor = DBusAdaptor(bus, "Player", self.__active)
+        self.__active.add_callable(self.__active_adaptor.update)
+        self.__dbus: ProxyInterface | None = None
+
+    @classmethod
+    def path(cls, mpris_name: str) -> str:
+        """
+        Returns the object path a player is exported at; characters not allowed in object paths become `_`.
+        """
+        return f"{cls.ROOT}/{re.sub(r'[^A-Za-z0-9_]', '_', mpris_name)}"
+
+    @property
+    def watchers(self) -> dict[str, MprisWatcher]:
+        """
+        Returns the watchers by the name of their player, without the `org.mpris.MediaPlayer2.` prefix
+        """
+        return {name: item[0] for (name, item) in self.__watchers.items()}
+
+    @property
+    def active(self) -> ActivePlayer:
+        return self.__active
+
+    @property
+    def interface_manager(self) -> InterfaceManager:
+        return self.__interface_manager
+
+    @property
+    def metrics(self) -> MetricsAdaptor:
+        return self.__metrics_adaptor
+
+    def __add(self, mpris_name: str) -> None:
+        if mpris_name in self.__watchers:
+            return
+        watcher = MprisWatcher(
+            self.__bus, mpris_name, self.__config, self.__interface_manager, self.__recorder, self.__parsed_cache
+        )
+        adaptor = DBusAdaptor(self.__bus, "Player", watcher)
+        watcher.add_callable(adaptor.update)
+        self.__bus.export(self.path(mpris_name), adaptor)
+        self.__watchers[mpris_name] = (watcher, adaptor, asyncio.ensure_future(watcher.watch()))
+        self.__active.add(watcher)
+
+    def __remove(self, mpris_name: str) -> None:
+        if mpris_name not in self.__watchers:
+            return
+        (watcher, adaptor, task) = self.__watchers.pop(mpris_name)
+        task.cancel()
+        self.__bus.unexport(self.path(mpris_name), adaptor)
+        self.__active.remove(watcher)
+
+    def __on_name_owner_changed(self, name: str, old_owner: str, new_owner: str) -> None:
+        if not name.startswith(self.PREFIX):
+            return
+        mpris_name = name[len(self.PREFIX):]
+        # A new owner is a new player process, whatever the old one left behind.
+        if old_owner != "":
+            self.__remove(mpris_name)
+        if new_owner != "":
+            self.__add(mpris_name)
+
+    async def run(self) -> None:
+        """
+        Watch the players until the bus disconnects, then tear every watcher down.
+        The caller claims `org.LyriK` beforehand, see `main`.
+        """
+        introspection = await self.__bus.introspect("org.freedesktop.DBus", "/org/freedesktop/DBus")
+        proxy = self.__bus.get_proxy_object("org.freedesktop.DBus", "/org/freedesktop/DBus", introspection)
+        self.__dbus = proxy.get_interface("org.freedesktop.DBus")
+        # Subscribe before listing, so that no player slips in between.
+        self.__dbus.on_name_owner_changed(self.__on_name_owner_changed)
+        self.__bus.export(f"{self.ROOT}/Active", self.__active_adaptor)
+        self.__bus.export("/org/LyriK/Metrics", self.__metrics_adaptor)
+        dump: asyncio.Task | None = None
+        if self.__prometheus_path != "":
+            dump = asyncio.ensure_future(self.__metrics_adaptor.dump(self.__prometheus_path, self.__dump_interval))
+        try:
+            for name in await self.__dbus.call_list_names():
+                if name.startswith(self.PREFIX):
+                    self.__add(name[len(self.PREFIX):])
+            await self.__bus.wait_for_disconnect()
+        finally:
+            self.__dbus.off_name_owner_changed(self.__on_name_owner_changed)
+            for mpris_name in list(self.__watchers):
+                self.__remove(mpris_name)
+            self.__bus.unexport(f"{self.ROOT}/Active", self.__active_adaptor)
+            self.__bus.unexport("/org/LyriK/Metrics", self.__metrics_adaptor)
+            if dump is not None:
+                dump.cancel()
+            if self.__recorder is not None:
+                self.__recorder.close()
+
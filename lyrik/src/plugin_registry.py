@@ -0,0 +1,121 @@
+import importlib
+import json
+import os
+import pkgutil
+
+from netwrok_interface import AbstractNetworkInterface
+
+
+class PluginRegistry:
+    """
+    The `PluginRegistry` class finds the lyrics interfaces without importing
+    them, so that start-up does not pay for the imports of every provider.
+    Interfaces come from three places:
+
+    - the built-in ones, listed in `BUILTIN`;
+    - the `lyrik.interfaces` entry point group, named after the interface's `name()`;
+    - `lyrik_interface*` modules on the path. Those are imported once to learn
+      which interfaces they define, and the answer is cached by module mtime.
+
+    Interface classes which are already imported are registered as they are.
+    """
+
+    GROUP = "lyrik.interfaces"
+    BUILTIN = {
+        "NeteaseMusicInterface": "netease_music_interface:NeteaseMusicInterface",
+        "LocalLibraryInterface": "local_library_interface:LocalLibraryInterface",
+    }
+    # Built-in interfaces with nothing to answer from until a key of their section is set.
+    REQUIRED = {
+        "LocalLibraryInterface": "Directories",
+    }
+
+    def __init__(self, path: list[str] | None = None, cache_path: str | None = None) -> None:
+        """
+        :param path: list[str] | None: Where to look for `lyrik_interface*` modules, `sys.path` if None
+        :param cache_path: str | None: The registry cache file, under `$XDG_CACHE_HOME/lyrik` if None
+        """
+        self.__path: list[str] | None = path
+        self.__cache_path: str = self.default_path() if cache_path is None else cache_path
+
+    @staticmethod
+    def default_path() -> str:
+        cache_home = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        return os.path.join(cache_home, "lyrik", "plugins.json")
+
+    def __read_cache(self) -> dict[str, dict]:
+        try:
+            with open(self.__cache_path) as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def __write_cache(self, cache: dict[str, dict]) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.__cache_path), exist_ok=True)
+            with open(self.__cache_path, "w") as file:
+                json.dump(cache, file)
+        except OSError:
+            pass
+
+    @staticmethod
+    def __inspect(module_name: str) -> dict[str, str]:
+        module = importlib.import_module(module_name)
+        return {
+            x.name(): f"{module_name}:{x.__qualname__}"
+            for x in vars(module).values()
+            if isinstance(x, type)
+            and issubclass(x, AbstractNetworkInterface)
+            and x.__module__ == module_name
+            and not getattr(x, "__abstractmethods__", None)
+        }
+
+    def discover(self) -> dict[str, str | type[AbstractNetworkInterface]]:
+        """
+        Find every interface.
+
+        :return: The "module:Class" reference of every interface by name, or the class itself if already imported
+        """
+        from importlib.metadata import entry_points
+
+        specs: dict[str, str | type[AbstractNetworkInterface]] = dict(self.BUILTIN)
+        for entry_point in entry_points(group=self.GROUP):
+            specs[entry_point.name] = entry_point.value
+
+        cache = self.__read_cache()
+        modules: dict[str, dict] = {}
+        for module in pkgutil.iter_modules(path=self.__path):
+            if not module.name.startswith("lyrik_interface"):
+                continue
+            spec = module.module_finder.find_spec(module.name)
+            mtime = os.stat(spec.origin).st_mtime_ns if spec is not None and spec.has_location else 0
+            cached = cache.get(module.name)
+            if cached is None or cached["mtime"] != mtime:
+                cached = {"mtime": mtime, "interfaces": self.__inspect(module.name)}
+            modules[module.name] = cached
+            specs.update(cached["interfaces"])
+        if modules != cache:
+            self.__write_cache(modules)
+
+        for interface_class in AbstractNetworkInterface.__subclasses__():
+            specs[interface_class.name()] = interface_class
+        return specs
+
+    def configured(self, name: str, config: dict[str]) -> bool:
+        """
+        Returns whether the interface called `name` can answer with its section of the configuration
+        """
+        return name not in self.REQUIRED or bool(config.get(self.REQUIRED[name]))
+
+    @staticmethod
+    def load(spec: str | type[AbstractNetworkInterface]) -> type[AbstractNetworkInterface]:
+        """
+        Import the interface class a reference from `discover` points to.
+        """
+        if isinstance(spec, type):
+            return spec
+        (module_name, _, qualname) = spec.partition(":")
+        interface_class = importlib.import_module(module_name)
+        for attribute in qualname.split("."):
+            interface_class = getattr(interface_class, attribute)
+        return interface_class
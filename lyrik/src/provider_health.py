@@ -0,0 +1,119 @@
+import asyncio
+import time
+
+
+class TokenBucket:
+    """
+    The `TokenBucket` class limits how often an interface is called: it holds
+    up to `capacity` tokens and refills `rate` tokens per second.
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.__rate: float = rate
+        self.__capacity: float = capacity
+        self.__tokens: float = capacity
+        self.__timestamp: float = time.monotonic()
+
+    @property
+    def tokens(self) -> float:
+        self.__refill()
+        return self.__tokens
+
+    def __refill(self) -> None:
+        now = time.monotonic()
+        self.__tokens = min(self.__capacity, self.__tokens + (now - self.__timestamp) * self.__rate)
+        self.__timestamp = now
+
+    async def acquire(self) -> None:
+        """
+        Take a token, waiting for the bucket to refill if it is empty.
+        """
+        self.__refill()
+        while self.__tokens < 1:
+            await asyncio.sleep((1 - self.__tokens) / self.__rate)
+            self.__refill()
+        self.__tokens -= 1
+
+
+class ProviderHealth:
+    """
+    The `ProviderHealth` class keeps an exponentially weighted moving average of
+    the latency and error rate of one interface, and a circuit breaker on top
+    of it. After `failure_threshold` consecutive failures the circuit opens and
+    the interface is skipped; once `cooldown` seconds passed a single probe
+    lookup is let through, which closes the circuit again if it succeeds.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, alpha: float = 0.2, failure_threshold: int = 3, cooldown: float = 30) -> None:
+        self.__alpha: float = alpha
+        self.__failure_threshold: int = failure_threshold
+        self.__cooldown: float = cooldown
+
+        self.__state: str = self.CLOSED
+        self.__opened_at: float = 0.0
+        self.__failures: int = 0
+        self.__latency: float | None = None
+        self.__error_rate: float = 0.0
+
+    @property
+    def state(self) -> str:
+        return self.__state
+
+    @property
+    def latency(self) -> float:
+        """
+        The EWMA of the latency in seconds, 0 before the first lookup.
+        """
+        return 0.0 if self.__latency is None else self.__latency
+
+    @property
+    def error_rate(self) -> float:
+        return self.__error_rate
+
+    def allow(self) -> bool:
+        """
+        Decide whether the interface may be queried now.
+        """
+        if self.__state == self.CLOSED:
+            return True
+        if self.__state == self.OPEN and time.monotonic() - self.__opened_at >= self.__cooldown:
+            self.__state = self.HALF_OPEN
+            return True
+        return False
+
+    def __record(self, latency: float, error: float) -> None:
+        if self.__latency is None:
+            self.__latency = latency
+        else:
+            self.__latency += self.__alpha * (latency - self.__latency)
+        self.__error_rate += self.__alpha * (error - self.__error_rate)
+
+    def record_success(self, latency: float) -> None:
+        self.__record(latency, 0.0)
+        self.__failures = 0
+        self.__state = self.CLOSED
+
+    def record_cancelled(self, elapsed: float) -> None:
+        """
+        Record a lookup which was cancelled because another interface won:
+        its latency is at least `elapsed`, which is all we learn about it.
+        A cancelled probe lets the next lookup probe again.
+        """
+        if self.__state == self.HALF_OPEN:
+            self.__state = self.OPEN
+        if elapsed > self.latency:
+            if self.__latency is None:
+                self.__latency = elapsed
+            else:
+                self.__latency += self.__alpha * (elapsed - self.__latency)
+
+    def record_failure(self, latency: float) -> None:
+        self.__record(latency, 1.0)
+        self.__failures += 1
+        if self.__state == self.HALF_OPEN or self.__failures >= self.__failure_threshold:
+            self.__state = self.OPEN
+            self.__opened_at = time.monotonic()
@@ -0,0 +1,234 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from typing import Any, Iterator
+
+from dbus_next.signature import Variant
+
+from netwrok_interface import LyricsResponse, NoFoundError
+
+
+def encode(value: Any) -> Any:
+    """
+    Turn D-Bus values into JSON values: a `Variant` becomes `{"~": signature, "v": value}`.
+    """
+    if isinstance(value, Variant):
+        return {"~": value.signature, "v": encode(value.value)}
+    if isinstance(value, dict):
+        return {key: encode(item) for (key, item) in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [encode(item) for item in value]
+    if isinstance(value, bytes):
+        return list(value)
+    return value
+
+
+def decode(value: Any) -> Any:
+    """
+    Reverse `encode`.
+    """
+    if isinstance(value, dict):
+        if "~" in value and "v" in value and len(value) == 2:
+            if value["~"] == "ay":
+                return Variant("ay", bytes(value["v"]))
+            return Variant(value["~"], decode(value["v"]))
+        return {key: decode(item) for (key, item) in value.items()}
+    if isinstance(value, list):
+        return [decode(item) for item in value]
+    return value
+
+
+class TraceRecorder:
+    """
+    The `TraceRecorder` class appends what LyriK sees of a session to a trace
+    file, one JSON array per line: the player state read by the watchers,
+    the `PropertiesChanged` and `Seeked` signals they receive, and every
+    answer of every interface along with its latency. Lyrics texts are
+    written once and referred to by number afterwards. Timestamps are
+    microseconds on the monotonic clock since the session started, and every
+    session starts with a header, so that a file can hold several sessions.
+
+    Records are `[time, kind, ...]`, with kind one of:
+
+    - `h`: header, `{"version", "time", "config"}`;
+    - `s`: `GetAll` result, `mpris_name, properties`;
+    - `p`: `PropertiesChanged`, `mpris_name, changed, invalidated`;
+    - `k`: `Seeked`, `mpris_name, position`;
+    - `x`: lyrics text, `number, text`;
+    - `r`: interface answer, `provider, title, album, artist, hazy_search, length, outcome, latency, payload`,
+      where outcome is one of `OUTCOMES` and payload is `[hazy, lyrics, {language: translation}]` for `ok`.
+      Answers of the lyrics cache have the provider `cache`, with the `track_id` of the lookup and the
+      interface which found the cached lyrics, or null, appended;
+      a peek at the cache, which neither searches nor knows `hazy_search` and `length`, records them as null.
+    """
+
+    VERSION = 1
+    OUTCOMES = ("ok", "none", "error", "timeout", "cancelled")
+
+    def __init__(self, path: str, config: dict[str] | None = None) -> None:
+        """
+        :param path: str: The trace file, appended to if it exists
+        :param config: dict[str] | None: The whole configuration, by section, kept in the header for the replay
+        """
+        directory = os.path.dirname(path)
+        if directory != "":
+            os.makedirs(directory, exist_ok=True)
+        self.__file = open(path, "a", encoding="utf-8")
+        self.__start: int = time.monotonic_ns()
+        self.__texts: dict[bytes, int] = {}
+        self.__write("h", {"version": self.VERSION, "time": time.time(), "config": {} if config is None else config})
+
+    def __write(self, kind: str, *fields: Any) -> None:
+        record = [(time.monotonic_ns() - self.__start) // 1000, kind, *fields]
+        self.__file.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")))
+        self.__file.write("\n")
+        # A trace is most useful right after a crash; a few lines per second are cheap to flush.
+        self.__file.flush()
+
+    def __text(self, text: str) -> int:
+        digest = hashlib.blake2b(text.encode(), digest_size=16).digest()
+        number = self.__texts.get(digest)
+        if number is None:
+            number = self.__texts[digest] = len(self.__texts)
+            self.__write("x", number, text)
+        return number
+
+    def sync(self, mpris_name: str, properties: dict[str, Variant]) -> None:
+        self.__write("s", mpris_name, encode(properties))
+
+    def properties_changed(self, mpris_name: str, changed: dict[str, Variant], invalidated: list[str]) -> None:
+        self.__write("p", mpris_name, encode(changed), invalidated)
+
+    def seeked(self, mpris_name: str, position: int) -> None:
+        self.__write("k", mpris_name, position)
+
+    def response(
+        self,
+        provider: str,
+        title: str,
+        album: str,
+        artist: list,
+        hazy_search: bool,
+        length: int | None,
+        latency: float,
+        response: LyricsResponse | BaseException | None,
+    ) -> None:
+        """
+        Record one answer of an interface.
+
+        :param latency: float: How long the interface took, in seconds
+        :param response: LyricsResponse | BaseException | None: The response, what the interface raised,
+            or None for a track known to have no lyrics
+        """
+        self.__write("r", *self.__answer(provider, title, album, artist, hazy_search, length, latency, response))
+
+    def cache(
+        self,
+        title: str,
+        album: str,
+        artist: list,
+        hazy_search: bool | None,
+        length: int | None,
+        track_id: str | None,
+        latency: float,
+        response: LyricsResponse | None,
+    ) -> None:
+        """
+        Record one hit of the lyrics cache, so that the replay can start with it cached.
+
+        :param track_id: str | None: The track identity the cache key was built with
+        :param response: LyricsResponse | None: The cached response, or None if the track is known to have no lyrics
+        """
+        self.__write(
+            "r",
+            *self.__answer("cache", title, album, artist, hazy_search, length, latency, response),
+            track_id,
+            None if response is None else response.interface,
+        )
+
+    def __answer(
+        self,
+        provider: str,
+        title: str,
+        album: str,
+        artist: list,
+        hazy_search: bool | None,
+        length: int | None,
+        latency: float,
+        response: LyricsResponse | BaseException | None,
+    ) -> list:
+        payload = None
+        if isinstance(response, LyricsResponse):
+            outcome = "ok"
+            translation = None
+            if response.translation is not None:
+                translation = {language: self.__text(text) for (language, text) in response.translation.items()}
+            payload = [response.hazy, self.__text(response.lyrics), translation]
+        elif response is None or isinstance(response, NoFoundError):
+            outcome = "none"
+        elif isinstance(response, asyncio.CancelledError):
+            outcome = "cancelled"
+        elif isinstance(response, asyncio.TimeoutError):
+            outcome = "timeout"
+        else:
+            outcome = "error"
+        return [provider, title, album, list(artist), hazy_search, length, outcome, int(latency * 1000000), payload]
+
+    def close(self) -> None:
+        self.__file.close()
+
+
+class TraceReader:
+    """
+    The `TraceReader` class reads the sessions of a trace file back, with the
+    lyrics texts resolved.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.__path: str = path
+
+    def sessions(self) -> Iterator[list[list]]:
+        """
+        Yield the records of every session, headers included, with D-Bus values decoded
+        and the lyrics of `r` records replaced by their texts.
+        """
+        session: list[list] | None = None
+        texts: dict[int, str] = {}
+        with open(self.__path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # The last line of a session may have been cut short by a crash.
+                    continue
+                kind = record[1]
+                if kind == "h":
+                    if session is not None:
+                        yield session
+                    session = []
+                    texts = {}
+                elif session is None:
+                    continue
+                elif kind == "x":
+                    texts[record[2]] = record[3]
+                    continue
+                elif kind in ("s", "p"):
+                    record[3] = decode(record[3])
+                elif kind == "r" and record[10] is not None:
+                    (hazy, lyrics, translation) = record[10]
+                    record[10] = [
+                        hazy,
+                        texts[lyrics],
+                        None if translation is None else {language: texts[x] for (language, x) in translation.items()},
+                    ]
+                session.append(record)
+        if session is not None:
+            yield session
+
+    def session(self, number: int = 0) -> list[list]:
+        for (i, session) in enumerate(self.sessions()):
+            if i == number:
+                return session
+        raise IndexError(f"{self.__path} has no session {number}")
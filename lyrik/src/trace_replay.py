@@ -0,0 +1,354 @@
+import argparse
+import asyncio
+import copy
+import json
+import subprocess
+import threading
+import time
+
+from dbus_next import Message
+from dbus_next.aio import MessageBus
+from dbus_next.service import ServiceInterface, dbus_property, PropertyAccess, signal
+from dbus_next.signature import Variant
+
+from netwrok_interface import AbstractNetworkInterface, LyricsResponse, NoFoundError, InternetError
+from interface_manager import InterfaceManager
+from lyrics_cache import LyricsCache
+from plugin_registry import PluginRegistry
+from player_supervisor import PlayerSupervisor
+from trace_recorder import TraceReader
+from lyrics_timeline import ParsedLyricsCache
+from metrics import metrics
+
+
+class ReplayPlayer(ServiceInterface):
+    """
+    The `ReplayPlayer` class plays the part of one recorded player: it holds
+    the state the trace says the player had, answers `GetAll` with it and
+    emits the recorded signals. At `speed` times real time the reported
+    `Rate` is multiplied by `speed`, so that the watcher's extrapolated
+    position follows the recorded one.
+    """
+
+    def __init__(self, speed: float) -> None:
+        super().__init__("org.mpris.MediaPlayer2.Player")
+        self.__speed: float = speed
+        self.__metadata: dict[str, Variant] = {}
+        self.__status: str = "Stopped"
+        self.__rate: float = 1.0
+        # The recorded position and the trace time it was recorded at, in microseconds.
+        self.__position: int = 0
+        self.__anchor: int = 0
+        self.now: int = 0
+
+    def __current_position(self) -> int:
+        if self.__status != "Playing":
+            return self.__position
+        return self.__position + int((self.now - self.__anchor) * self.__rate)
+
+    def apply(self, properties: dict[str, Variant]) -> None:
+        """
+        Take the recorded state over, anchoring the position at the current trace time.
+        """
+        self.__position = self.__current_position()
+        self.__anchor = self.now
+        if "Metadata" in properties:
+            self.__metadata = properties["Metadata"].value
+        if "PlaybackStatus" in properties:
+            self.__status = properties["PlaybackStatus"].value
+        if "Rate" in properties:
+            self.__rate = properties["Rate"].value
+        if "Position" in properties:
+            self.__position = properties["Position"].value
+
+    def changed(self, properties: dict[str, Variant], invalidated: list[str]) -> None:
+        self.apply(properties)
+        changed = {name: variant.value for (name, variant) in properties.items()}
+        if "Rate" in changed:
+            changed["Rate"] = self.Rate
+        self.emit_properties_changed(changed, invalidated)
+
+    def seeked(self, position: int) -> None:
+        self.__position = position
+        self.__anchor = self.now
+        self.Seeked()
+
+    @dbus_property(PropertyAccess.READ)
+    def Metadata(self) -> "a{sv}":
+        return self.__metadata
+
+    @dbus_property(PropertyAccess.READ)
+    def Position(self) -> "x":
+        return self.__current_position()
+
+    @dbus_property(PropertyAccess.READ)
+    def PlaybackStatus(self) -> "s":
+        return self.__status
+
+    @dbus_property(PropertyAccess.READ)
+    def Rate(self) -> "d":
+        return self.__rate * self.__speed if self.__speed > 0 else self.__rate
+
+    @signal()
+    def Seeked(self) -> "x":
+        return self.__current_position()
+
+
+class ReplayInterface:
+    """
+    The `ReplayInterface` class answers lookups with the recorded answers of
+    the interface it stands in for, after the recorded latency divided by
+    `speed`. Answers to the same lookup are given in the recorded order, the
+    last one repeating. An interface which was cancelled in the recording
+    answers nothing once its recorded latency, a lower bound, is over.
+    `ReplayRegistry` creates one interface class per recorded interface,
+    named after it. It is not an `AbstractNetworkInterface` itself, so that
+    importing this module does not register it as an interface.
+    """
+
+    answers: dict[tuple, list[tuple[str, int, list | None]]] = {}
+    speed: float = 1.0
+
+    def __init__(self, transport=None, config: dict[str] | None = None) -> None:
+        super().__init__(transport, config)
+        self.__given: dict[tuple, int] = {}
+
+    @classmethod
+    def name(cls) -> str:
+        return cls.__name__
+
+    async def get_lyrics(
+        self, title: str, album: str, artist: list, hazy_search=True, length: int | None = None
+    ) -> LyricsResponse:
+        key = (title, album, tuple(artist), hazy_search)
+        answers = self.answers.get(key)
+        if answers is None:
+            metrics.increment("replay_unrecorded", self.name())
+            raise NoFoundError(self, title, artist, album)
+        given = self.__given.get(key, 0)
+        self.__given[key] = given + 1
+        (outcome, latency, payload) = answers[min(given, len(answers) - 1)]
+        if self.speed > 0:
+            await asyncio.sleep(latency / 1000000 / self.speed)
+        if outcome == "ok":
+            return LyricsResponse(payload[0], payload[1], payload[2], self.name())
+        if outcome == "timeout":
+            raise asyncio.TimeoutError()
+        if outcome == "error":
+            raise InternetError(self)
+        raise NoFoundError(self, title, artist, album)
+
+
+class ReplayRegistry(PluginRegistry):
+    """
+    The `ReplayRegistry` class discovers a `ReplayInterface` in place of every
+    interface which answered in the recorded session. Answers of the lyrics
+    cache are left to `TraceReplayer`.
+    """
+
+    # The stand-ins answer from the trace, whatever the configuration of the interfaces they replace.
+    REQUIRED = {}
+
+    def __init__(self, session: list[list], speed: float) -> None:
+        super().__init__([])
+        answers: dict[str, dict[tuple, list]] = {}
+        for record in session:
+            if record[1] != "r" or record[2] == "cache":
+                continue
+            (provider, title, album, artist, hazy_search, length, outcome, latency, payload) = record[2:11]
+            key = (title, album, tuple(artist), hazy_search)
+            answers.setdefault(provider, {}).setdefault(key, []).append((outcome, latency, payload))
+        self.__classes: dict[str, type[ReplayInterface]] = {
+            name: type(
+                name, (ReplayInterface, AbstractNetworkInterface), {"answers": x, "speed": speed, "remote": speed > 0}
+            )
+            for (name, x) in answers.items()
+        }
+
+    def discover(self) -> dict[str, str | type[AbstractNetworkInterface]]:
+        return dict(self.__classes)
+
+
+class TraceReplayer:
+    """
+    The `TraceReplayer` class feeds one recorded session back through a
+    `PlayerSupervisor`, and with it the watchers, the `InterfaceManager` and
+    the `DBusAdaptor`s, on a private `dbus-daemon`. The recorded players run
+    on their own thread, so that the CPU time of the main thread is the cost
+    of LyriK alone. At `speed` 1 the session is replayed in real time; every
+    duration is divided by `speed`, and at 0 the records are sent as fast as
+    possible, without waiting for anything. Tracks the recording found in the
+    lyrics cache before searching them are cached from the start.
+    """
+
+    def __init__(self, session: list[list], speed: float = 1.0) -> None:
+        self.__session: list[list] = session
+        self.__speed: float = speed
+        self.__players: dict[str, ReplayPlayer] = {}
+        self.__player_loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+        self.__stopped: asyncio.Event | None = None
+
+    def __config(self) -> dict[str]:
+        config: dict[str] = copy.deepcopy(self.__session[0][2].get("config", {}))
+        config.pop("Trace", None)
+        config.setdefault("Metrics", {})["PrometheusPath"] = ""
+        general = config.setdefault("General", {})
+        interface = config.setdefault("Interface", {"Disabled": [], "Priority": []})
+        interface["Disabled"] = []
+        if self.__speed > 0:
+            for (section, key, default) in (
+                (general, "Debounce", 150),
+                (general, "SyncInterval", 5000),
+                (general, "PrefetchLead", 10000),
+                (interface, "Timeout", 5000),
+                (interface, "Deadline", 8000),
+                (interface, "Cooldown", 30000),
+            ):
+                section[key] = section.get(key, default) / self.__speed
+            interface["RateLimit"] = interface.get("RateLimit", 2) * self.__speed
+        else:
+            general["Debounce"] = 0
+        return config
+
+    def __cache(self) -> LyricsCache:
+        """
+        Returns a private lyrics cache holding what the recorded one held when the session started.
+        """
+        cache = LyricsCache(":memory:")
+        searched: set[tuple] = set()
+        for record in self.__session:
+            if record[1] != "r":
+                continue
+            (provider, title, album, artist) = record[2:6]
+            if provider != "cache":
+                searched.add((title, album, tuple(artist)))
+            elif (title, album, tuple(artist)) not in searched:
+                (payload, track_id, interface) = record[10:13]
+                response = None if payload is None else LyricsResponse(payload[0], payload[1], payload[2], interface)
+                cache.store(LyricsCache.key(title, album, artist, track_id), response)
+        return cache
+
+    async def __play(self, address: str, done: threading.Event) -> None:
+        self.__stopped = asyncio.Event()
+        buses: dict[str, MessageBus] = {}
+        start = time.monotonic()
+        first = self.__session[0][0]
+        for record in self.__session[1:]:
+            (timestamp, kind) = record[:2]
+            if self.__speed > 0:
+                await asyncio.sleep(max(start + (timestamp - first) / 1000000 / self.__speed - time.monotonic(), 0))
+            if kind not in ("s", "p", "k"):
+                continue
+            player = self.__players.get(record[2])
+            if player is None:
+                # A player appears with its first record, so that it is never watched without a state.
+                player = self.__players[record[2]] = ReplayPlayer(self.__speed)
+                player.now = timestamp
+                if kind in ("s", "p"):
+                    player.apply(record[3])
+                bus = buses[record[2]] = await MessageBus(bus_address=address).connect()
+                bus.export("/org/mpris/MediaPlayer2", player)
+                await bus.request_name(f"org.mpris.MediaPlayer2.{record[2]}")
+            else:
+                player.now = timestamp
+                if kind == "s":
+                    player.apply(record[3])
+                elif kind == "p":
+                    player.changed(record[3], record[4])
+                else:
+                    player.seeked(record[3])
+            if self.__speed == 0:
+                # The reply comes after LyriK handled everything this player sent before.
+                await buses[record[2]].call(
+                    Message(destination="org.LyriK", path="/", interface="org.freedesktop.DBus.Peer", member="Ping")
+                )
+        done.set()
+        await self.__stopped.wait()
+        for bus in buses.values():
+            bus.disconnect()
+
+    def __run_players(self, address: str, done: threading.Event) -> None:
+        asyncio.set_event_loop(self.__player_loop)
+        self.__player_loop.run_until_complete(self.__play(address, done))
+
+    async def run(self, tail: float = 1.0) -> dict:
+        """
+        Replay the session and report what it cost.
+
+        :param tail: float: How long to keep running after the last record, in seconds of the recording
+        :return: The metrics gathered during the replay
+        """
+        daemon = subprocess.Popen(
+            ["dbus-daemon", "--session", "--nofork", "--print-address"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+        )
+        try:
+            address = daemon.stdout.readline().strip()
+            config = self.__config()
+            bus = await MessageBus(bus_address=address).connect()
+            await bus.request_name("org.LyriK")
+            interface_manager = InterfaceManager(
+                None,
+                config["Interface"],
+                self.__cache(),
+                registry=ReplayRegistry(self.__session, self.__speed),
+            )
+            # Like the lyrics cache, the parsed lyrics cache is private and in memory, so that replays are repeatable.
+            supervisor = PlayerSupervisor(bus, config, interface_manager, ParsedLyricsCache())
+            metrics.reset()
+            cpu = time.thread_time()
+            started = time.monotonic()
+            task = asyncio.ensure_future(supervisor.run())
+            # Let the supervisor list the players before any appears.
+            await asyncio.sleep(0.1)
+            done = threading.Event()
+            thread = threading.Thread(target=self.__run_players, args=(address, done), daemon=True)
+            thread.start()
+            while not done.is_set():
+                await asyncio.sleep(0.05)
+            await asyncio.sleep(tail / self.__speed if self.__speed > 0 else 0.1)
+            elapsed = time.monotonic() - started
+            cpu = time.thread_time() - cpu
+            bus.disconnect()
+            await asyncio.gather(task, return_exceptions=True)
+            self.__player_loop.call_soon_threadsafe(self.__stopped.set)
+            thread.join()
+            return {
+                "records": len(self.__session),
+                "speed": self.__speed,
+                "seconds": elapsed,
+                "cpu_seconds": cpu,
+                "stages_us": {
+                    f"{stage}/{provider}" if provider != "" else stage: histogram.summary()
+                    for ((stage, provider), histogram) in sorted(metrics.histograms.items())
+                },
+                "counters": {
+                    f"{name}/{provider}" if provider != "" else name: value
+                    for ((name, provider), value) in sorted(supervisor.metrics.counters().items())
+                },
+            }
+        finally:
+            daemon.kill()
+            daemon.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a recorded LyriK session.")
+    parser.add_argument("trace", help="the trace file, recorded with [Trace] Path")
+    parser.add_argument("--session", type=int, default=0, help="which session of the file to replay")
+    parser.add_argument("--speed", type=float, default=1.0, help="times real time, 0 for as fast as possible")
+    parser.add_argument("--output", default=None, help="where to write the results as JSON")
+    options = parser.parse_args()
+
+    session = TraceReader(options.trace).session(options.session)
+    results = asyncio.run(TraceReplayer(session, options.speed).run())
+    if options.output is not None:
+        with open(options.output, "w") as file:
+            json.dump(results, file, indent=2)
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
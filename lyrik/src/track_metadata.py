@@ -0,0 +1,21 @@
+from dbus_next.signature import Variant
+
+
+def read_track(metadata: dict[str:Variant]) -> tuple[str, str, list]:
+    """
+    Read the title, album and artists of a song from its MPRIS metadata.
+    Players may leave any of them out, e.g. browsers, and some send a single
+    artist as a string.
+
+    :param metadata: dict[str:Variant]: The `Metadata` of a player, or of a track of its track list
+    :return: The title, album and artists, empty when missing
+    :raises TypeError: If any of them is not made of strings
+    """
+    title = metadata["xesam:title"].value if "xesam:title" in metadata else ""
+    album = metadata["xesam:album"].value if "xesam:album" in metadata else ""
+    artist = metadata["xesam:artist"].value if "xesam:artist" in metadata else []
+    if isinstance(artist, str):
+        artist = [artist]
+    if not isinstance(title, str) or not isinstance(album, str) or not all(isinstance(a, str) for a in artist):
+        raise TypeError("xesam:title, xesam:album and xesam:artist must be strings")
+    return title, album, artist
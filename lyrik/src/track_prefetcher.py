@@ -0,0 +1,129 @@
+import asyncio
+
+from dbus_next.aio import ProxyInterface, ProxyObject
+from dbus_next.errors import DBusError
+from dbus_next.signature import Variant
+
+from interface_manager import InterfaceManager, NetworkError, AllNoFoundError
+from lyrics_timeline import ParsedLyricsCache, parsed_lyrics_cache
+from track_metadata import read_track
+
+from loguru import logger
+
+
+class TrackPrefetcher:
+    """
+    The `TrackPrefetcher` class resolves the lyrics of the upcoming tracks in
+    the background, so that a track change finds them already cached.
+    When the player has a `org.mpris.MediaPlayer2.TrackList`, the next `count`
+    tracks are looked up right after every track change. Otherwise the next
+    track is unknown, and the interfaces are only warmed up once the current
+    track is within `lead` seconds of its end.
+    """
+
+    def __init__(
+        self,
+        proxy: ProxyObject,
+        interface_manager: InterfaceManager,
+        count: int = 2,
+        concurrency: int = 1,
+        lead: float = 10,
+        tolerance: int = 250000,
+        parsed_cache: ParsedLyricsCache = parsed_lyrics_cache,
+    ) -> None:
+        """
+        :param proxy: ProxyObject: The proxy of the player's `/org/mpris/MediaPlayer2` object
+        :param interface_manager: InterfaceManager: The manager to resolve lyrics with
+        :param count: int: How many upcoming tracks to prefetch
+        :param concurrency: int: How many prefetches may run at once
+        :param lead: float: How long before the end of a track to warm up, in seconds
+        :param tolerance: int: The translation alignment tolerance in microseconds
+        :param parsed_cache: ParsedLyricsCache: The cache to parse the prefetched lyrics into
+        """
+        self.__root: ProxyInterface = proxy.get_interface("org.mpris.MediaPlayer2")
+        self.__track_list: ProxyInterface = proxy.get_interface("org.mpris.MediaPlayer2.TrackList")
+        self.__interface_manager: InterfaceManager = interface_manager
+        self.__count: int = count
+        self.__semaphore: asyncio.Semaphore = asyncio.Semaphore(concurrency)
+        self.__lead: int = int(lead * 1000000)
+        self.__tolerance: int = tolerance
+        self.__parsed_cache: ParsedLyricsCache = parsed_cache
+
+        self.__has_track_list: bool | None = None
+        self.__length: int = 0
+        self.__warmed_up: bool = True
+        self.__tasks: set[asyncio.Task] = set()
+
+    def track_changed(self, metadata: dict[str:Variant]) -> None:
+        """
+        Cancel the prefetches for the previous track and start the ones for the new track.
+        """
+        self.cancel()
+        self.__length = metadata["mpris:length"].value if "mpris:length" in metadata else 0
+        self.__warmed_up = False
+        if "mpris:trackid" in metadata:
+            self.__spawn(self.__prefetch_track_list(metadata["mpris:trackid"].value))
+
+    def tick(self, position: int) -> None:
+        """
+        Follow the playback position, to warm up near the end of tracks when
+        there is no track list to prefetch from.
+        """
+        if self.__warmed_up or self.__has_track_list is not False or self.__length <= 0:
+            return
+        if self.__length - position <= self.__lead:
+            self.__warmed_up = True
+            self.__spawn(self.__interface_manager.warm_up())
+
+    def cancel(self) -> None:
+        for task in self.__tasks:
+            task.cancel()
+
+    def __spawn(self, coroutine) -> None:
+        task = asyncio.ensure_future(coroutine)
+        self.__tasks.add(task)
+        task.add_done_callback(self.__tasks.discard)
+
+    async def __prefetch_track_list(self, track_id: str) -> None:
+        try:
+            if self.__has_track_list is None:
+                self.__has_track_list = await self.__root.get_has_track_list()
+            if not self.__has_track_list:
+                return
+            tracks: list[str] = await self.__track_list.get_tracks()
+            if track_id not in tracks:
+                return
+            start = tracks.index(track_id) + 1
+            upcoming = tracks[start:start + self.__count]
+            if len(upcoming) == 0:
+                return
+            metadata: list[dict[str:Variant]] = await self.__track_list.call_get_tracks_metadata(upcoming)
+        except DBusError:
+            self.__has_track_list = False
+            return
+        await asyncio.gather(*(self.__prefetch(item) for item in metadata))
+
+    async def __prefetch(self, metadata: dict[str:Variant]) -> None:
+        try:
+            (title, album, artist) = read_track(metadata)
+        except TypeError as exception:
+            logger.critical(f"Cannot read the metadata of an upcoming track: {exception!r}")
+            return
+        if title == "":
+            return
+        track_id = metadata.get("xesam:url") or metadata.get("mpris:trackid")
+        async with self.__semaphore:
+            try:
+                response = await self.__interface_manager.get_lyrics(
+                    title,
+                    album,
+                    artist,
+                    True,
+                    None if track_id is None else track_id.value,
+                    background=True,
+                    length=metadata["mpris:length"].value if "mpris:length" in metadata else None,
+                )
+            except (AllNoFoundError, NetworkError):
+                return
+        # Parse ahead too, so that the track change is a pure cache hit.
+        self.__parsed_cache.load(response.lyrics, response.translation, self.__tolerance)
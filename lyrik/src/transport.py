@@ -0,0 +1,161 @@
+import abc
+import asyncio
+import json
+from typing import Any, Callable, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import aiohttp
+
+
+class TransportError(Exception):
+    def __init__(self, url: str, reason: str) -> None:
+        self.url = url
+        self.reason = reason
+
+    def __str__(self) -> str:
+        return f"Request to {self.url} failed: {self.reason}"
+
+
+class AbstractTransport(abc.ABC):
+    """
+    The `AbstractTransport` class is the HTTP client shared by every interface.
+    `InterfaceManager` owns one and hands it to the interfaces it constructs.
+    """
+
+    @abc.abstractmethod
+    async def post(
+        self, url: str, data: dict[str, Any] | None = None, headers: dict[str, str] | None = None
+    ) -> dict[str, Any]:
+        """
+        Post a form and decode the JSON answer.
+
+        :raises TransportError: If the request fails or the answer is not JSON
+        """
+        pass
+
+    @abc.abstractmethod
+    async def close(self) -> None:
+        pass
+
+    async def warm_up(self, url: str) -> None:
+        """
+        Open a kept-alive connection to the host of `url` ahead of the next lookup.
+        """
+        pass
+
+
+class HttpTransport(AbstractTransport):
+    """
+    The `HttpTransport` class keeps one pooled `aiohttp` session alive, so the
+    search pages and lyric requests of a lookup reuse kept-alive connections
+    and cached DNS answers instead of paying TCP and TLS setup every time.
+    `aiohttp` is only imported along with the first request.
+    """
+
+    def __init__(
+        self,
+        limit: int = 32,
+        limit_per_host: int = 8,
+        dns_cache_ttl: int = 300,
+        keepalive_timeout: float = 60,
+        timeout: float = 10,
+    ) -> None:
+        self.__limit: int = limit
+        self.__limit_per_host: int = limit_per_host
+        self.__dns_cache_ttl: int = dns_cache_ttl
+        self.__keepalive_timeout: float = keepalive_timeout
+        self.__timeout: float = timeout
+        self.__session: "aiohttp.ClientSession | None" = None
+
+    @classmethod
+    def from_config(cls, config: dict[str]) -> "HttpTransport":
+        """
+        Build a transport from the `Transport` section of the configuration.
+        """
+        return cls(
+            config.get("Limit", 32),
+            config.get("LimitPerHost", 8),
+            config.get("DNSCacheTTL", 300),
+            config.get("KeepAlive", 60),
+            config.get("Timeout", 10),
+        )
+
+    def __get_session(self) -> "aiohttp.ClientSession":
+        import aiohttp
+
+        # The session has to be created inside the running event loop.
+        if self.__session is None or self.__session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.__limit,
+                limit_per_host=self.__limit_per_host,
+                ttl_dns_cache=self.__dns_cache_ttl,
+                keepalive_timeout=self.__keepalive_timeout,
+            )
+            self.__session = aiohttp.ClientSession(
+                connector=connector, timeout=aiohttp.ClientTimeout(total=self.__timeout)
+            )
+        return self.__session
+
+    async def post(
+        self, url: str, data: dict[str, Any] | None = None, headers: dict[str, str] | None = None
+    ) -> dict[str, Any]:
+        import aiohttp
+
+        try:
+            async with self.__get_session().post(url, data=data, headers=headers) as response:
+                return await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError, json.JSONDecodeError) as exception:
+            raise TransportError(url, repr(exception)) from exception
+
+    async def warm_up(self, url: str) -> None:
+        import aiohttp
+
+        try:
+            async with self.__get_session().head(url):
+                pass
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            pass
+
+    async def close(self) -> None:
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+
+
+class StubTransport(AbstractTransport):
+    """
+    The `StubTransport` class answers requests locally from a table of routes,
+    for testing and benchmarking interfaces offline. Routes map a method and
+    a URL, e.g. `("POST", "https://music.163.com/api/song/lyric")`, to a
+    canned JSON answer, or to a callable building the answer from the posted
+    form. Every request is appended to `requests`; unknown routes fail like
+    a network error.
+    """
+
+    def __init__(
+        self,
+        routes: dict[tuple[str, str], dict[str, Any] | Callable[[dict[str, Any] | None], dict[str, Any]]],
+        latency: float = 0,
+    ) -> None:
+        """
+        :param routes: dict[tuple[str, str], dict[str, Any] | Callable]: The answers by method and URL
+        :param latency: float: How long every request takes, in seconds
+        """
+        self.__routes = routes
+        self.__latency: float = latency
+        self.requests: list[tuple[str, str, dict[str, Any] | None]] = []
+
+    async def post(
+        self, url: str, data: dict[str, Any] | None = None, headers: dict[str, str] | None = None
+    ) -> dict[str, Any]:
+        self.requests.append(("POST", url, data))
+        if self.__latency > 0:
+            await asyncio.sleep(self.__latency)
+        route = self.__routes.get(("POST", url))
+        if route is None:
+            raise TransportError(url, "no route")
+        return route(data) if callable(route) else route
+
+    async def close(self) -> None:
+        pass